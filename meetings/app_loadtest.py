@@ -0,0 +1,232 @@
+"""
+End-to-end load test of the Flask app with stand-in back ends.
+
+    python3 app_loadtest.py [--users N] [--schedules S] [--rounds R]
+                            [--threads T] [--calendars C] [--events E]
+                            [--latency SECONDS] [--real-mongo] [--gevent]
+
+Boots flask_main.app in process with each user's Google calendars
+served by a fake_gcal.FakeCalendarService (C calendars of E events
+each, answering after the given latency) and, unless --real-mongo
+is given, the schedules collection in mongomock.  It then creates S
+schedules through /_create and has N users, T at a time, each go
+through a schedule's page, /choose, /_events (polling its job until
+it's done) and the free-time feed R times.  "/_events job" is the
+time from posting to /_events to the job being done.  It reports p50/p95/p99 latency and throughput per route.
+Configuration is read from credentials.ini as the app does.  With
+--gevent, the run is made on greenlets as gevent_main serves the app,
+so --threads can go into the hundreds.
+"""
+
+import sys
+if "--gevent" in sys.argv:
+    # Has to happen before anything imports socket or threading
+    from gevent import monkey
+    monkey.patch_all()
+
+import argparse
+import collections
+import concurrent.futures
+import datetime
+import json
+import logging
+import random
+import time
+
+import mongomock
+import pymongo
+from oauth2client import client
+
+import fake_gcal
+from schedules_loadtest import AtomicCollection
+
+
+# Schedules run the two weeks from next Monday, so that they aren't
+# past their expiry (and deleted by Mongo) as soon as they are made
+TODAY = datetime.date.today()
+MONDAY = TODAY + datetime.timedelta(days=7 - TODAY.weekday())
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda p: samples[min(len(samples) - 1, int(p * len(samples)))]
+    return pick(0.5) * 1000, pick(0.95) * 1000, pick(0.99) * 1000
+
+
+def boot(real_mongo):
+    """ flask_main, imported with its Mongo client swapped if asked """
+    if not real_mongo:
+        stand_in = mongomock.MongoClient()
+        pymongo.MongoClient = lambda *args, **kwargs: stand_in
+    import flask_main
+    if not real_mongo:
+        # mongomock doesn't apply updates atomically; mongod does
+        flask_main.collection = AtomicCollection(flask_main.collection)
+    flask_main.app.testing = True
+    logging.getLogger().setLevel(logging.WARNING)
+    flask_main.app.logger.setLevel(logging.WARNING)
+    return flask_main
+
+
+def user_service(user, calendars, events, latency, rand):
+    """
+    FakeCalendarService for user, with a primary calendar and
+    calendars - 1 more, each with events one to two hour events in
+    the two weeks from MONDAY
+    """
+    service = fake_gcal.FakeCalendarService(latency)
+    start = datetime.datetime.combine(MONDAY, datetime.time(8, tzinfo=datetime.timezone.utc))
+    for c in range(calendars):
+        cal_id = user if c == 0 else "{}-{}".format(user, c)
+        service.add_calendar(cal_id, primary=(c == 0))
+        for _ in range(events):
+            begin = start + datetime.timedelta(minutes=15 * rand.randrange(14 * 96))
+            service.add_event(cal_id, begin,
+                              begin + datetime.timedelta(minutes=rand.choice([60, 90, 120])))
+    return service
+
+
+def credentials_for(user):
+    """
+    Unexpired credentials for user; only the access token and the ID
+    token's subject are used
+    """
+    expiry = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+    return client.OAuth2Credentials(user, "loadtest", "loadtest", None, expiry,
+                                    "https://oauth2.googleapis.com/token",
+                                    "app_loadtest",
+                                    id_token={ "sub": user }).to_json()
+
+
+def post_json(client_, url, body):
+    """
+    client_.post of body as JSON (test clients only take json= from
+    Flask 1.0)
+    """
+    return client_.post(url, data=json.dumps(body),
+                        content_type="application/json")
+
+
+def json_of(response):
+    """ A response's JSON body (Response.get_json is Flask 1.0 too) """
+    return json.loads(response.get_data(as_text=True))
+
+
+class Recorder:
+    """ Latencies and error counts per route """
+
+    def __init__(self):
+        self.samples = collections.defaultdict(list)
+        self.errors = collections.Counter()
+
+    def request(self, route, call, *args, **kwargs):
+        start = time.perf_counter()
+        response = call(*args, **kwargs)
+        self.samples[route].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[route] += 1
+        return response
+
+
+def visit(app, recorder, user, uid, rounds):
+    """ One user's trips through a schedule """
+    client_ = app.test_client()
+    with client_.session_transaction() as session:
+        session["credentials"] = credentials_for(user)
+    for _ in range(rounds):
+        recorder.request("/schedule/<uid>", client_.get, "/schedule/" + uid)
+        recorder.request("/choose", client_.get, "/choose")
+        with client_.session_transaction() as session:
+            cal_ids = [ cal["id"] for cal in session.get("calendars", []) ]
+        start = time.perf_counter()
+        job = json_of(recorder.request("/_events", post_json, client_,
+                                       "/_events", { "ids": cal_ids }))
+        # Then poll, as the page does, until the busy times are in
+        while True:
+            status = json_of(recorder.request("/_jobs/<id>", client_.get,
+                                              "/_jobs/" + job["job"]))
+            if status["status"] in ("done", "failed"):
+                break
+            time.sleep(0.01)
+        if status["status"] == "failed":
+            recorder.errors["/_events job"] += 1
+        recorder.samples["/_events job"].append(time.perf_counter() - start)
+        recorder.request("/schedule/<uid>/free", client_.get,
+                         "/schedule/{}/free?start={}&end={}".format(
+                             uid, MONDAY - datetime.timedelta(days=1),
+                             MONDAY + datetime.timedelta(days=6)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end app load test")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--schedules", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=2,
+                        help="Trips through the app per user")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--calendars", type=int, default=3,
+                        help="Calendars per user")
+    parser.add_argument("--events", type=int, default=100,
+                        help="Events per calendar")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Seconds each fake Google request takes")
+    parser.add_argument("--real-mongo", action="store_true",
+                        help="Use the database in credentials.ini")
+    parser.add_argument("--gevent", action="store_true",
+                        help="Run on greenlets, as gevent_main serves")
+    args = parser.parse_args()
+
+    flask_main = boot(args.real_mongo)
+    rand = random.Random(322)
+    users = [ "user{}@example.com".format(u) for u in range(args.users) ]
+    services = { user: user_service(user, args.calendars, args.events,
+                                    args.latency, rand)
+                 for user in users }
+    flask_main.get_gcal_service = (
+        lambda credentials, timeout=None: services[credentials.access_token])
+
+    recorder = Recorder()
+    run = int(time.time())
+    uids = [ "loadtest{}-{}".format(run, s) for s in range(args.schedules) ]
+    creator = flask_main.app.test_client()
+    for uid in uids:
+        recorder.request("/_create", post_json, creator, "/_create", {
+            "id": uid, "daterange": "{:%m/%d/%Y} - {:%m/%d/%Y}".format(
+                MONDAY, MONDAY + datetime.timedelta(days=13)),
+            "begintime": "9:00am", "endtime": "5:00pm",
+            "timezone": "America/Los_Angeles", "weekdays": True })
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(args.threads) as pool:
+        visits = [ pool.submit(visit, flask_main.app, recorder, user,
+                               uids[u % len(uids)], args.rounds)
+                   for u, user in enumerate(users) ]
+        for future in visits:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    print("{} users, {} at a time{}, {} calendars of {} events, {:.0f}ms Google latency".format(
+        args.users, args.threads, " on gevent" if args.gevent else "",
+        args.calendars, args.events, args.latency * 1000))
+    print("{:<24} {:>7} {:>7} {:>9} {:>9} {:>9} {:>9}".format(
+        "route", "count", "errors", "p50 ms", "p95 ms", "p99 ms", "req/s"))
+    for route, samples in recorder.samples.items():
+        # Schedules are created before the timed run
+        seconds = sum(samples) if route == "/_create" else elapsed
+        print("{:<24} {:>7} {:>7} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}".format(
+            route, len(samples), recorder.errors[route],
+            *percentiles(samples), len(samples) / seconds))
+    total = sum(len(s) for route, s in recorder.samples.items()
+                if route not in ("/_create", "/_events job"))
+    print("{} requests in {:.2f}s: {:.1f}/s".format(total, elapsed, total / elapsed))
+    submits = sum(flask_main.collection.find_one({ "uid": uid })["version"]
+                  for uid in uids)
+    print("{} busy-time submits landed".format(submits))
+
+    if args.real_mongo:
+        for uid in uids:
+            flask_main.collection.delete_one({ "uid": uid })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+An in-process stand-in for the Google Calendar v3 service object,
+for tests and load testing without Google credentials.
+
+Supports the calls this app makes: events().list (with paging,
+timeMin/timeMax and incremental sync tokens) and calendarList().list
+(with paging and If-None-Match against its etag).
+Requests are recorded in .requests and can be slowed down with a
+per-calendar latency.
+"""
+
+import itertools
+import threading
+import time
+
+import httplib2
+from apiclient.errors import HttpError
+
+from times import timestamp, to_arrow
+
+
+class FakeRequest:
+
+    def __init__(self, func, params):
+        self._func = func
+        self._params = params
+        self.headers = { }
+
+    def execute(self):
+        return self._func(self.headers, **self._params)
+
+
+class FakeResource:
+
+    def __init__(self, func):
+        self._func = func
+
+    def list(self, **params):
+        return FakeRequest(self._func, params)
+
+
+class FakeCalendarService:
+
+
+    def __init__(self, latency=0):
+        self.calendars = { }
+        self.requests = [ ]
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self._version = 0
+        self._oldest_sync = 0
+        self._calendars_version = 0
+
+
+    def add_calendar(self, cal_id, summary=None, primary=False,
+                     latency=None):
+        self._calendars_version += 1
+        self.calendars[cal_id] = { "summary": summary or cal_id,
+                                   "primary": primary,
+                                   "latency": latency,
+                                   "events": { } }
+
+
+    def add_event(self, cal_id, begin, end, all_day=False):
+        """ Add an event from begin to end (anything timestamp takes) """
+        event_id = "e{}".format(next(self._seq))
+        self._put(cal_id, event_id, begin, end, all_day)
+        return event_id
+
+
+    def move_event(self, cal_id, event_id, begin, end):
+        self._put(cal_id, event_id, begin, end)
+
+
+    def delete_event(self, cal_id, event_id):
+        with self._lock:
+            self._version += 1
+            event = self.calendars[cal_id]["events"][event_id]
+            event["status"] = "cancelled"
+            event["updated"] = self._version
+
+
+    def expire_sync_tokens(self):
+        """ Make every sync token handed out so far answer 410 Gone """
+        self._oldest_sync = self._version + 1
+
+
+    def _put(self, cal_id, event_id, begin, end, all_day=False):
+        with self._lock:
+            self._version += 1
+            if all_day:
+                start = { "date": to_arrow(timestamp(begin)).format("YYYY-MM-DD") }
+                finish = { "date": to_arrow(timestamp(end)).format("YYYY-MM-DD") }
+            else:
+                start = { "dateTime": to_arrow(timestamp(begin)).isoformat() }
+                finish = { "dateTime": to_arrow(timestamp(end)).isoformat() }
+            self.calendars[cal_id]["events"][event_id] = {
+                "id": event_id, "status": "confirmed", "start": start,
+                "end": finish, "updated": self._version,
+                "_span": (timestamp(begin), timestamp(end)) }
+
+
+    def _wait(self, cal_id):
+        latency = self.calendars[cal_id]["latency"]
+        time.sleep(self.latency if latency is None else latency)
+
+
+    def _page(self, items, page_token, max_results):
+        start = int(page_token or 0)
+        stop = start + (max_results or 250)
+        page = { "items": [ { k: v for k, v in item.items()
+                              if not k.startswith("_") }
+                            for item in items[start:stop] ] }
+        if stop < len(items):
+            page["nextPageToken"] = str(stop)
+        return page
+
+
+    def _list_events(self, headers, calendarId, timeMin=None, timeMax=None,
+                     syncToken=None, pageToken=None, maxResults=None,
+                     orderBy=None, **params):
+        self.requests.append(dict(params, calendarId=calendarId,
+                                  timeMin=timeMin, timeMax=timeMax,
+                                  syncToken=syncToken, pageToken=pageToken))
+        self._wait(calendarId)
+        with self._lock:
+            version = self._version
+            events = list(self.calendars[calendarId]["events"].values())
+        if syncToken is not None:
+            if int(syncToken) < self._oldest_sync:
+                raise HttpError(httplib2.Response({ "status": 410 }),
+                                b"Sync token is no longer valid")
+            items = [ e for e in events if e["updated"] > int(syncToken) ]
+        else:
+            items = [ e for e in events if e["status"] != "cancelled" ]
+            if timeMin is not None:
+                items = [ e for e in items if e["_span"][1] > timestamp(timeMin) ]
+            if timeMax is not None:
+                items = [ e for e in items if e["_span"][0] < timestamp(timeMax) ]
+        if orderBy == "startTime":
+            items.sort(key=lambda e: e["_span"][0])
+        page = self._page(items, pageToken, maxResults)
+        if "nextPageToken" not in page:
+            page["nextSyncToken"] = str(version)
+        return page
+
+
+    def _list_calendars(self, headers, pageToken=None, maxResults=None, **params):
+        self.requests.append(dict(params, pageToken=pageToken,
+                                  ifNoneMatch=headers.get("If-None-Match")))
+        etag = '"{}"'.format(self._calendars_version)
+        if headers.get("If-None-Match") == etag:
+            raise HttpError(httplib2.Response({ "status": 304 }), b"")
+        items = [ { "kind": "calendar#calendarListEntry", "id": cal_id,
+                    "summary": cal["summary"], "selected": True,
+                    "primary": cal["primary"] }
+                  for cal_id, cal in sorted(self.calendars.items()) ]
+        page = self._page(items, pageToken, maxResults)
+        page["etag"] = etag
+        return page
+
+
+    def events(self):
+        return FakeResource(self._list_events)
+
+
+    def calendarList(self):
+        return FakeResource(self._list_calendars)
@@ -4,14 +4,20 @@ from flask import request
 from flask import url_for
 import uuid
 from times import Chunk, Block
-
+import gcal
+import jobs
+import metrics
+import schedules
+import sessions
+import tokens
+import windows
+
+import concurrent.futures
+import gzip
 import json
 import logging
-
-# Date handling
-import arrow  # Replacement for datetime, based on moment.js
-# import datetime but we still need time
-from dateutil import tz  # For interpreting local times
+import sys
+import time
 
 
 # OAuth2  - Google library implementation for convenience
@@ -23,6 +29,7 @@ from apiclient import discovery
 
 # Pymongo
 from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
 
 
 ###
@@ -41,10 +48,95 @@ app.debug = CONFIG.DEBUG
 app.logger.setLevel(logging.DEBUG)
 app.secret_key = CONFIG.SECRET_KEY
 
-SCOPES = 'https://www.googleapis.com/auth/calendar.readonly'
+# openid gets an ID token naming the Google account alongside the
+# access token; see account_id
+SCOPES = 'https://www.googleapis.com/auth/calendar.readonly openid'
 CLIENT_SECRET_FILE = CONFIG.GOOGLE_KEY_FILE  # You'll need this
 APPLICATION_NAME = 'MeetMe class project'
 
+# Interval engine for /_events: "block" (times.Block, one calendar at
+# a time) or "numpy" (times_numpy, every calendar at once).  "parallel"
+# is "block" for /_events, and works out best slots and free times over
+# a month or more a week at a time on a pool of PARALLEL_PROCESSES
+# processes (times_parallel; default one per CPU), which pays off for
+# large groups over long ranges
+TIMES_ENGINE = getattr(CONFIG, "TIMES_ENGINE", "block")
+if TIMES_ENGINE == "numpy":
+    import times_numpy
+elif TIMES_ENGINE == "parallel":
+    import times_parallel
+    times_parallel.PROCESSES = getattr(CONFIG, "PARALLEL_PROCESSES", None)
+    # Forked now, before Mongo's client or any of our pools start threads
+    if not times_parallel.under_gevent():
+        times_parallel.pool(times_parallel.PROCESSES)
+
+# Calendars fetched at once by /_events, and seconds before giving up
+# on any one calendar's request.  Fetches share one pool of threads,
+# so each thread's keep-alive connections outlive a single /_events
+FETCH_WORKERS = getattr(CONFIG, "FETCH_WORKERS", 8)
+FETCH_TIMEOUT = getattr(CONFIG, "FETCH_TIMEOUT", 10)
+# Seconds each calendar gets for all of its pages
+FETCH_DEADLINE = getattr(CONFIG, "FETCH_DEADLINE", 30)
+FETCH_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=FETCH_WORKERS)
+# Events per page of a calendar's event list (Google allows up to 2500)
+EVENTS_PAGE_SIZE = getattr(CONFIG, "EVENTS_PAGE_SIZE", 250)
+
+# Calendar services share one parsed discovery document (read from
+# DISCOVERY_FILE if given) and per-thread keep-alive connections,
+# unless CACHE_SERVICE = False
+SERVICE_FACTORY = None
+if getattr(CONFIG, "CACHE_SERVICE", True):
+    SERVICE_FACTORY = gcal.ServiceFactory(getattr(CONFIG, "DISCOVERY_FILE", None))
+
+# Busy times per (user, calendar, range), refreshed by incremental sync
+BUSY_CACHE = gcal.BusyCache(size=getattr(CONFIG, "BUSY_CACHE_SIZE", 1024),
+                            ttl=getattr(CONFIG, "BUSY_CACHE_TTL", 3600))
+
+# Calendar lists per user, rechecked with Google after CALENDAR_LIST_TTL
+# seconds (a conditional request that costs a 304 if nothing changed);
+# calendar_entries is defined with the other helpers below
+CALENDAR_LISTS = gcal.CalendarListCache(
+    lambda items: calendar_entries(items),
+    size=getattr(CONFIG, "CALENDAR_LIST_CACHE_SIZE", 1024),
+    ttl=getattr(CONFIG, "CALENDAR_LIST_TTL", 300))
+
+# Days a schedule is kept after the end of its range
+SCHEDULE_TTL_DAYS = getattr(CONFIG, "SCHEDULE_TTL_DAYS", 180)
+
+# IANA time zone for schedules whose creator's browser didn't say
+DEFAULT_TIMEZONE = getattr(CONFIG, "DEFAULT_TIMEZONE", "UTC")
+
+# Most candidate meetings /schedule/<uid>/slots will answer with
+MAX_SLOTS = getattr(CONFIG, "MAX_SLOTS", 50)
+
+# Free times per schedule, recomputed only when its version changes
+FREE_TIMES = schedules.FreeTimes(getattr(CONFIG, "FREE_TIMES_CACHE_SIZE", 256),
+                                 TIMES_ENGINE, DEFAULT_TIMEZONE)
+
+# Stage timings and counters served at /metrics (METRICS = False turns
+# them off), and a cProfile of every PROFILE_EVERY'th request written
+# to PROFILE_DIR if set
+METRICS = metrics.Metrics(getattr(CONFIG, "METRICS", True))
+PROFILER = None
+if getattr(CONFIG, "PROFILE_EVERY", 0):
+    PROFILER = metrics.Sampler(CONFIG.PROFILE_EVERY, getattr(CONFIG, "PROFILE_DIR", "."))
+
+# Session contents are kept server side, in Mongo (shared by every
+# worker) or, with SESSION_STORE = memory, in this process; the cookie
+# only carries a signed id.  SESSION_STORE = cookie keeps Flask's
+# signed-cookie sessions.
+SESSION_STORE = getattr(CONFIG, "SESSION_STORE", "mongo")
+
+# Parsed credentials per session, reparsed only when they change
+CREDENTIALS = sessions.ParsedCache(client.OAuth2Credentials.from_json)
+
+# Access tokens are refreshed in the background once they are within
+# TOKEN_REFRESH_MARGIN seconds of expiring, and before use once expired
+TOKENS = tokens.TokenRefresher(getattr(CONFIG, "TOKEN_REFRESH_MARGIN", 300),
+                               getattr(CONFIG, "TOKEN_REFRESH_WORKERS", 4),
+                               FETCH_TIMEOUT,
+                               getattr(CONFIG, "SESSION_CACHE_SIZE", 10000))
+
 MONGO_CLIENT_URL = "mongodb://{}:{}@{}:{}/{}".format(
     CONFIG.DB_USER,
     CONFIG.DB_USER_PW,
@@ -54,6 +146,10 @@ MONGO_CLIENT_URL = "mongodb://{}:{}@{}:{}/{}".format(
 
 print("Using Mongo URL '{}'".format(MONGO_CLIENT_URL))
 
+if SESSION_STORE == "memory":
+    app.session_interface = sessions.ServerSideSessionInterface(
+        sessions.MemoryStore(getattr(CONFIG, "SESSION_CACHE_SIZE", 10000)))
+
 
 ###
 # DB Setup
@@ -64,6 +160,12 @@ try:
     dbclient = MongoClient(MONGO_CLIENT_URL)
     db = getattr(dbclient, CONFIG.DB)
     collection = db.schedules
+    schedules.ensure_indexes(collection)
+    # Busy-time fetches run off the request path, tracked in db.jobs
+    JOBS = jobs.JobQueue(db.jobs, getattr(CONFIG, "JOB_WORKERS", 4))
+    if SESSION_STORE == "mongo":
+        app.session_interface = sessions.ServerSideSessionInterface(
+            sessions.MongoStore(db.sessions, getattr(CONFIG, "SESSION_TTL_DAYS", 14)))
 
 except:
     print("Failure opening database.  Is Mongo running? Correct password?")
@@ -98,26 +200,32 @@ def choose():
 
     gcal_service = get_gcal_service(credentials)
     app.logger.debug("Returned from get_gcal_service")
-    flask.session['calendars'] = list_calendars(gcal_service)
+    calendars = list_calendars(gcal_service, account_id(credentials))
+    if flask.session.get('calendars') != calendars:
+        flask.session['calendars'] = calendars
+    # The primary calendar's id is the account's address; it keys
+    # this user's cached busy times
+    for cal in calendars:
+        if cal['primary'] and flask.session.get('user') != cal['id']:
+            flask.session['user'] = cal['id']
     return flask.redirect("/schedule/" + flask.session['uid'])
 
 # http://exploreflask.com/en/latest/views.html
 @app.route("/schedule/<unique_id>")
 def schedule(unique_id):
-    # UID to redirect to after account selection
-    flask.session['uid'] = unique_id
+    # UID to redirect to after account selection; only set when it
+    # changes, since setting it marks the session for saving
+    if flask.session.get('uid') != unique_id:
+        flask.session['uid'] = unique_id
     flask.g.uid = unique_id
-    # Iterate through times in db, add to list
-    schedule = []
-    document = collection.find_one({ "uid":unique_id })
-    for time in document["times"]:
-        if time['begin'] != time['end']: # HACK solution to my Block logic issue
-            schedule.append({ 'title': 'Free',
-                              'start': time['begin'],
-                              'end': time['end'] })
+    # Free times are fetched by the calendar a window at a time from
+    # /schedule/<uid>/free, so the page itself stays small
+    db_schedule = collection.find_one({ "uid": unique_id }, schedules.RANGE_FIELDS)
+    if db_schedule is None:
+        flask.abort(404)
+    flask.g.first_day = db_schedule["range"]["begin"][:10]
 
     # Setting data
-    flask.g.times = schedule
     try:
         flask.g.calendars = flask.session['calendars']
     except KeyError:
@@ -127,6 +235,157 @@ def schedule(unique_id):
     return render_template("schedule.html")
 
 
+@app.route("/schedule/<unique_id>/free")
+def free_times(unique_id):
+    """
+    Free times of a schedule as a FullCalendar event feed: only those
+    between the start and end arguments (ISO dates, in the schedule's
+    time zone) are sent.  Responses carry an ETag and Last-Modified
+    from the schedule's version, so revisiting a window is answered
+    with a 304 until someone submits busy times.  The ETag is weak,
+    since gzipped and plain bodies share it.
+    """
+    head = collection.find_one({ "uid": unique_id }, schedules.HEAD_FIELDS)
+    if head is None:
+        flask.abort(404)
+    start, end = request.args.get('start'), request.args.get('end')
+    etag = "{}-{}-{}-{}".format(unique_id, head.get("version", 0), start, end)
+    modified = schedules.last_modified(head)
+    if 'If-None-Match' in request.headers:
+        # The ETag is exact; If-Modified-Since, only good to the
+        # second, is then ignored (RFC 7232 section 6)
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        not_modified = bool(modified and request.if_modified_since and
+                            modified.replace(microsecond=0) <=
+                            request.if_modified_since.replace(tzinfo=None))
+    if not_modified:
+        response = flask.Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    zone = windows.get_tz(head.get("timezone", DEFAULT_TIMEZONE))
+    try:
+        lo = windows.parse_bound(start, zone) if start else None
+        hi = windows.parse_bound(end, zone) if end else None
+    except (ValueError, OverflowError):
+        flask.abort(400)
+    found = FREE_TIMES.lookup(collection, unique_id, lo, hi, head)
+    if found is None:
+        flask.abort(404)
+    # Times are shown in the schedule's own time zone
+    free, tzinfo = found
+    schedule = [ { 'title': 'Free', 'start': span['begin'], 'end': span['end'] }
+                 for span in schedules.block_to_db(free, tzinfo) ]
+
+    response = flask.jsonify(schedule)
+    response.set_etag(etag, weak=True)
+    if modified:
+        response.last_modified = modified
+    response.cache_control.no_cache = True
+    return gzipped(response)
+
+
+@app.route("/schedule/<unique_id>/slots")
+def best_slots(unique_id):
+    """
+    The best times for a meeting of duration minutes, starting every
+    granularity minutes (default 15), optionally only between the
+    after and before times of day and the start and end dates, as a
+    list of the top k (default 5) ranked by how many participants are
+    free: [{ start, end, free, of }]
+    """
+    args = request.args
+    try:
+        duration = int(args['duration']) * 60
+        granularity = int(args.get('granularity', 15)) * 60
+        k = min(int(args.get('k', 5)), MAX_SLOTS)
+        preferred = None
+        if 'after' in args or 'before' in args:
+            preferred = (windows.parse_clock(args.get('after', '00:00')),
+                         windows.parse_clock(args.get('before', '23:59')))
+    except (KeyError, ValueError):
+        flask.abort(400)
+    if duration <= 0 or granularity <= 0 or k <= 0:
+        flask.abort(400)
+
+    db_schedule = collection.find_one({ "uid": unique_id }, schedules.FREE_FIELDS)
+    if db_schedule is None:
+        flask.abort(404)
+    zone = windows.get_tz(db_schedule.get("timezone", DEFAULT_TIMEZONE))
+    try:
+        lo = windows.parse_bound(args['start'], zone) if 'start' in args else None
+        hi = windows.parse_bound(args['end'], zone) if 'end' in args else None
+    except (ValueError, OverflowError):
+        flask.abort(400)
+
+    found = schedules.best_slots(db_schedule, duration, granularity, k,
+                                 preferred, lo, hi, DEFAULT_TIMEZONE,
+                                 TIMES_ENGINE)
+    participants = len(db_schedule.get("busy", []))
+    return flask.jsonify([ { 'start': windows.isoformat(begin, zone),
+                             'end': windows.isoformat(end, zone),
+                             'free': free, 'of': participants }
+                           for begin, end, free in found ])
+
+
+@app.route("/metrics")
+def metrics_page():
+    """ Request and stage timings and cache counters, for Prometheus """
+    # Everything but the cache's size only ever goes up, so is a counter
+    for name, value in BUSY_CACHE.stats().items():
+        if name == "size":
+            METRICS.gauge("busy_cache_size", value)
+        else:
+            METRICS.total("busy_cache_{}_total".format(name), value)
+    METRICS.total("calendar_list_hits_total", CALENDAR_LISTS.hits)
+    METRICS.total("calendar_list_not_modified_total", CALENDAR_LISTS.not_modified)
+    METRICS.total("calendar_list_misses_total", CALENDAR_LISTS.misses)
+    METRICS.total("free_times_hits_total", FREE_TIMES.hits)
+    METRICS.total("free_times_misses_total", FREE_TIMES.misses)
+    METRICS.total("token_refreshes_total", TOKENS.refreshes)
+    METRICS.total("token_refresh_failures_total", TOKENS.failures)
+    if SERVICE_FACTORY:
+        METRICS.total("service_builds_total", SERVICE_FACTORY.builds)
+        METRICS.total("service_build_seconds_total", SERVICE_FACTORY.build_seconds)
+    return flask.Response(METRICS.render(),
+                          mimetype="text/plain; version=0.0.4")
+
+
+def start_request():
+    flask.g.request_start = time.perf_counter()
+    flask.g.profile = PROFILER.start() if PROFILER else None
+
+
+def note_status(response):
+    flask.g.status = response.status_code
+    return response
+
+
+def finish_request(exc):
+    """
+    Record a request's time and status, and stop its profile.  Run at
+    teardown, which (unlike after_request) also comes after an
+    unhandled exception; the status is then a 500.
+    """
+    if "request_start" not in flask.g:
+        return
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    status = 500 if exc is not None else flask.g.get("status", 500)
+    METRICS.observe("request_seconds",
+                    time.perf_counter() - flask.g.request_start, route=route)
+    METRICS.count("responses_total", route=route, status=status)
+    if flask.g.profile:
+        app.logger.info("Profile written to " + PROFILER.stop(flask.g.profile, route))
+
+
+# Requests are only timed when something will read the timings
+if METRICS.enabled or PROFILER:
+    app.before_request(start_request)
+    app.after_request(note_status)
+    app.teardown_request(finish_request)
+
+
 ####
 #
 #  Google calendar authorization:
@@ -162,20 +421,37 @@ def valid_credentials():
     Returns OAuth2 credentials if we have valid
     credentials in the session.  This is a 'truthy' value.
     Return None if we don't have credentials, or if they
-    have expired or are otherwise invalid.  This is a 'falsy' value.
+    are invalid or have expired and can't be refreshed.
+    This is a 'falsy' value.
     """
     if 'credentials' not in flask.session:
       return None
 
-    credentials = client.OAuth2Credentials.from_json(
-        flask.session['credentials'])
-
-    if (credentials.invalid or
-        credentials.access_token_expired):
+    # Server-side sessions have an id; cookie sessions are told
+    # apart by the credentials themselves
+    text = flask.session['credentials']
+    key = getattr(flask.session, 'sid', text)
+    credentials = TOKENS.fresh(key, CREDENTIALS.get(key, text))
+    if credentials is None:
       return None
+    # A refresh (maybe one started by an earlier request) gave a new
+    # access token, so store it in place of the old one
+    if TOKENS.refreshed(key):
+      text = credentials.to_json()
+      flask.session['credentials'] = text
+      CREDENTIALS.put(getattr(flask.session, 'sid', text), text, credentials)
     return credentials
 
-def get_gcal_service(credentials):
+def account_id(credentials):
+    """
+    The Google account credentials were issued for (their ID token's
+    subject), or None if they don't say, as credentials from before
+    the openid scope was asked for don't
+    """
+    id_token = credentials.id_token or { }
+    return id_token.get('sub')
+
+def get_gcal_service(credentials, timeout=None):
   """
   We need a Google calendar 'service' object to obtain
   list of calendars, busy times, etc.  This requires
@@ -184,10 +460,18 @@ def get_gcal_service(credentials):
   control flow will be interrupted by authorization, and we'll
   end up redirected back to /choose *without a service object*.
   Then the second call will succeed without additional authorization.
+  timeout, in seconds, bounds each request made with the service.
   """
   app.logger.debug("Entering get_gcal_service")
-  http_auth = credentials.authorize(httplib2.Http())
-  service = discovery.build('calendar', 'v3', http=http_auth)
+  if SERVICE_FACTORY:
+    service = SERVICE_FACTORY(credentials, timeout)
+  else:
+    # Uncached path, kept to compare build times against
+    start = time.perf_counter()
+    http_auth = credentials.authorize(httplib2.Http(timeout=timeout))
+    service = discovery.build('calendar', 'v3', http=http_auth)
+    app.logger.debug("Built calendar service in {:.1f}ms".format(
+        (time.perf_counter() - start) * 1000))
   app.logger.debug("Returning service")
   return service
 
@@ -226,6 +510,10 @@ def oauth2callback():
     auth_code = flask.request.args.get('code')
     credentials = flow.step2_exchange(auth_code)
     flask.session['credentials'] = credentials.to_json()
+    # These may be another account's credentials; what was known
+    # about the last account goes until /choose lists this one's
+    flask.session.pop('user', None)
+    flask.session.pop('calendars', None)
     ## Now I can build the service and execute the query,
     ## but for the moment I'll just log it and go back to
     ## the main screen
@@ -246,90 +534,124 @@ def create():
     uid = request.json['id']
     # Get date data from json
     daterange = request.json['daterange'].split()
-    begin_date = arrow.get(interpret_date(daterange[0]))
-    end_date = arrow.get(interpret_date(daterange[2]))
-    begin_time = arrow.get(interpret_time(request.json['begintime']))
-    end_time = arrow.get(interpret_time(request.json['endtime']))
-    # Calculate number of days
-    diff = ((end_date - begin_date).days) + 1
-    # Get time range for first day
-    begin = add_time(begin_date, begin_time)
-    end = add_time(begin_date, end_time)
-
-    # Calcuate time ranges for each day
-    initial = []
-    for day in range(diff):
-        initial.append({ 'begin': begin, 'end': end })
-        begin = next_day(begin)
-        end = next_day(end)
-
-    # TODO check to see if id already used? or lazy ;) ideal would be using
-    # the prexisting document IDs
-    
-    # Create the db object
-    collection.insert({ "type": "schedule", "uid": uid,
-                        "range": { "begin": add_time(begin_date, begin_time),
-                                   "end": add_time(end_date, end_time) },
-                        "times": initial })
+    begin_date = interpret_date(daterange[0])
+    end_date = interpret_date(daterange[2])
+    begin_time = interpret_time(request.json['begintime'])
+    end_time = interpret_time(request.json['endtime'])
+    # Windows are in the creator's time zone, as the browser reports it
+    timezone = request.json.get('timezone') or DEFAULT_TIMEZONE
+    try:
+        zone = windows.get_tz(timezone)
+    except ValueError:
+        app.logger.debug("Unknown time zone: {!r}".format(timezone))
+        return flask.jsonify(False)
+
+    # Stored as a rule; each day's window is worked out when read
+    exclude = [ interpret_date(text) for text in request.json.get('exclude', []) ]
+    rule = windows.DailyRule(begin_date, end_date, begin_time, end_time, zone,
+                             bool(request.json.get('weekdays')), exclude)
+
+    # Create the db object; the unique index on uid turns away
+    # an id that is already used
+    try:
+        collection.insert_one(schedules.new_document(uid, timezone, rule,
+                                                     SCHEDULE_TTL_DAYS))
+    except DuplicateKeyError:
+        app.logger.debug("Schedule id already used: " + uid)
+        return flask.jsonify(False)
     return flask.jsonify(True)
 
 
 @app.route('/_events', methods=['POST', 'GET'])
 def events():
     """
-    Get event data for selected calendars and send back to frontend
-    using AJAX
+    Queue a job fetching the selected calendars' busy times into the
+    schedule, and send its id back to the frontend (False if the user
+    has to log in again) to poll /_jobs/<id> with
     """
     # Grab unique schedule id for DB querying
     uid = flask.session['uid']
+    # Busy times are stored per participant; sessions that haven't
+    # been through /choose get an id of their own
+    participant = flask.session.setdefault('user', str(uuid.uuid4()))
     # Get selected calendars
     selected_cals = request.json['ids']
     # Get GCal service
-    service = valid_credentials()
-    if service:
-        service = get_gcal_service(service)
-    else: # If credentiasl aren't valid get new ones
+    with METRICS.timer("events_stage_seconds", stage="credentials"):
+        credentials = valid_credentials()
+    if not credentials: # If credentiasl aren't valid get new ones
         return flask.jsonify(False)
+    job_id = JOBS.submit("events", submit_calendars, uid, participant,
+                         selected_cals, credentials)
+    return flask.jsonify({ "job": job_id })
+
+
+@app.route('/_jobs/<job_id>')
+def job_status(job_id):
+    """ Status of a job queued by /_events, for the frontend to poll """
+    job = JOBS.status(job_id)
+    if job is None:
+        flask.abort(404)
+    return flask.jsonify({ "status": job["status"], "error": job.get("error") })
+
+
+def submit_calendars(uid, participant, selected_cals, credentials):
+    """
+    Fetch participant's busy times from selected_cals and add them to
+    schedule uid.  Run as a background job, outside any request.
+    """
+    # Each fetching thread needs a GCal service of its own
+    def make_service():
+        with METRICS.timer("events_stage_seconds", stage="service"):
+            return get_gcal_service(credentials, FETCH_TIMEOUT)
     # Get db object
-    db_schedule = collection.find_one({ "uid": uid })
+    with METRICS.timer("events_stage_seconds", stage="schedule_read"):
+        db_schedule = collection.find_one({ "uid": uid }, schedules.RANGE_FIELDS)
     # Get vals from db object
-    begin_query = arrow.get(db_schedule["range"]["begin"])
-    end_query = arrow.get(db_schedule["range"]["end"])
-    free_chunk = Chunk(begin_query, end_query)
-    db_block = db_to_block(db_schedule["times"])
-
-    # Iterate through selected calendars
-    for cal_id in selected_cals:
-        # Block containing calendar data
-        block = Block()
-        # Query for calendar events
-        events = service.events().list(calendarId=cal_id, # Calendar selection
-                                       timeMin=begin_query, # Open time
-                                       timeMax=end_query, # Close time
-                                       singleEvents=True, # No recurring event selection, fixes no summary index errors
-                                       orderBy="startTime").execute() # Order events by startTime and execute query
-
-        # Iterate through each event in calendar
-        for event in events['items']:
-            # Get arrow objects for start and end range
-            arrow_start = arrow.get(event['start']['dateTime'])
-            arrow_end = arrow.get(event['end']['dateTime'])
-            # Add chunk to calendar block
-            block.append(Chunk(arrow_start, arrow_end))
-
-        # Check if any events in block, fixes indexing errors
-        if len(block._chunks) > 0:
-            # Get free times for calendar
-            block = block.complement(free_chunk)
-            # Intersect calendar free times with db free times
-            db_block = db_block.intersect(block)
-        else:
+    free_chunk = Chunk(db_schedule["range"]["begin"], db_schedule["range"]["end"])
+    # Google takes the range as RFC 3339 text
+    begin_query = windows.isoformat(free_chunk.begin_ts)
+    end_query = windows.isoformat(free_chunk.end_ts)
+
+    # Fetch selected calendars concurrently, handling each as it lands;
+    # time spent on the interval math in between isn't counted as fetching
+    busy = Block()
+    busy_blocks = []
+    fetch_start = time.perf_counter()
+    math_seconds = 0.0
+    fetched = gcal.fetch_blocks(make_service, selected_cals,
+                                begin_query, end_query, FETCH_WORKERS,
+                                EVENTS_PAGE_SIZE, BUSY_CACHE, participant,
+                                FETCH_POOL, FETCH_DEADLINE)
+    for cal_id, block in fetched:
+        math_start = time.perf_counter()
+        METRICS.count("calendars_fetched_total")
+        METRICS.count("intervals_fetched_total", len(block))
+        # Check if any events in block
+        if len(block) == 0:
             app.logger.debug("No events in time range in calendar: " + cal_id)
-    # Update the db with new free times
-    collection.update_one({ "uid": uid },
-                          { "$set": { "times": block_to_db(db_block) } })
-
-    return flask.jsonify(True)
+        elif TIMES_ENGINE == "numpy":
+            # Merged with the other calendars all at once below
+            busy_blocks.append(block)
+        else:
+            # Add calendar's busy times to participant's
+            busy = busy.union(block)
+        math_seconds += time.perf_counter() - math_start
+    METRICS.observe("events_stage_seconds",
+                    time.perf_counter() - fetch_start - math_seconds, stage="fetch")
+
+    math_start = time.perf_counter()
+    if busy_blocks:
+        busy = times_numpy.union_block(busy_blocks)
+    # Only busy times within the schedule's range matter
+    busy = busy.intersect(Block([ free_chunk ]))
+    METRICS.observe("events_stage_seconds",
+                    math_seconds + time.perf_counter() - math_start, stage="block_math")
+    app.logger.debug("Busy cache: {}".format(BUSY_CACHE.stats()))
+    # Add participant's busy times to the db; free times are
+    # worked out from them when the schedule is next read
+    with METRICS.timer("events_stage_seconds", stage="submit"):
+        schedules.submit_busy(collection, uid, participant, busy)
 
 
 ####
@@ -339,83 +661,74 @@ def events():
 ####
 
 
+def gzipped(response, min_size=500):
+    """
+    Compress response's body with gzip if the client accepts it and
+    it's big enough to be worth it
+    """
+    if ('gzip' not in request.accept_encodings or
+            len(response.get_data()) < min_size):
+        return response
+    response.set_data(gzip.compress(response.get_data()))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
 def interpret_time( text ):
     """
     Read time in a human-compatible format and
-    interpret as ISO format with local timezone.
+    interpret as an (hour, minute) pair.
     May throw exception if time can't be interpreted. In that
     case it will also flash a message explaining accepted formats.
     """
     app.logger.debug("Decoding time '{}'".format(text))
-    time_formats = ["ha", "h:mma",  "h:mm a", "H:mm"]
     try:
-        as_arrow = arrow.get(text, time_formats).replace(tzinfo=tz.tzlocal())
-        as_arrow = as_arrow.replace(year=2016) #HACK see below
+        clock = windows.parse_clock(text)
         app.logger.debug("Succeeded interpreting time")
-    except:
+    except ValueError:
         app.logger.debug("Failed to interpret time")
         flask.flash("Time '{}' didn't match accepted formats 13:30 or 1:30pm"
               .format(text))
         raise
-    return as_arrow.isoformat()
-    #HACK #Workaround
-    # isoformat() on raspberry Pi does not work for some dates
-    # far from now.  It will fail with an overflow from time stamp out
-    # of range while checking for daylight savings time.  Workaround is
-    # to force the date-time combination into the year 2016, which seems to
-    # get the timestamp into a reasonable range. This workaround should be
-    # removed when Arrow or Dateutil.tz is fixed.
-    # FIXME: Remove the workaround when arrow is fixed (but only after testing
-    # on raspberry Pi --- failure is likely due to 32-bit integers on that platform)
+    return clock
 
 def interpret_date( text ):
     """
-    Convert text of date to ISO format used internally,
-    with the local time zone.
+    Convert text of date to a datetime.date
     """
     try:
-      as_arrow = arrow.get(text, "MM/DD/YYYY").replace(
-          tzinfo=tz.tzlocal())
-    except:
-        flask.flash("Date '{}' didn't fit expected format 12/31/2001")
+      date = windows.parse_date(text)
+    except ValueError:
+        flask.flash("Date '{}' didn't fit expected format 12/31/2001"
+              .format(text))
         raise
-    return as_arrow.isoformat()
-
-def next_day(isotext):
-    """
-    ISO date + 1 day (used in query to Google calendar)
-    """
-    as_arrow = arrow.get(isotext)
-    return as_arrow.replace(days=+1).isoformat()
-
-def add_time(date_text, time_text):
-    """
-    Add hour and minute component from ISO date to another ISO date
-    """
-    date_arrow = arrow.get(date_text)
-    time_arrow = arrow.get(time_text)
+    return date
 
-    return date_arrow.shift(hours=+time_arrow.hour,
-                            minutes=+time_arrow.minute).isoformat()
-
-def list_calendars(service):
+def list_calendars(service, user=None):
     """
     Given a google 'service' object, return a list of
     calendars.  Each calendar is represented by a dict.
     The returned list is sorted to have
     the primary calendar first, and selected (that is, displayed in
     Google Calendars web app) calendars before unselected calendars.
+    Lists are cached per user, which must be the account the
+    service's credentials are for (see account_id), and refreshed
+    only when Google says they've changed; without a user they
+    aren't cached.
     """
     app.logger.debug("Entering list_calendars")
-    calendar_list = service.calendarList().list().execute()["items"]
+    return CALENDAR_LISTS.calendars(service, user)
+
+def calendar_entries(calendar_list):
+    """
+    The dicts list_calendars gives for a calendar listing's items,
+    sorted
+    """
     result = [ ]
     for cal in calendar_list:
         kind = cal["kind"]
         id = cal["id"]
-        if "description" in cal:
-            desc = cal["description"]
-        else:
-            desc = "(no description)"
         summary = cal["summary"]
         # Optional binary attributes with False as default
         selected = ("selected" in cal) and cal["selected"]
@@ -447,19 +760,6 @@ def cal_sort_key( cal ):
        primary_key = "X"
     return (primary_key, selected_key, cal["summary"])
 
-def block_to_db(block):
-    result = []
-    for chunk in block._chunks:
-        result.append({'begin': chunk._begin.isoformat(), 'end': chunk._end.isoformat()})
-    return result
-
-def db_to_block(arr):
-    block = Block()
-    for time in arr:
-        block.append(Chunk(arrow.get(time['begin']), arrow.get(time['end'])))
-    return block
-
-
 #############
 
 
@@ -0,0 +1,102 @@
+import nose, datetime, json, os, re
+import mongomock
+import pymongo
+
+# flask_main reads credentials.ini when it is imported
+HERE = os.path.dirname(os.path.abspath(__file__))
+if not any(os.path.exists(os.path.join(where, "credentials.ini"))
+           for where in (os.getcwd(), HERE)):
+    raise nose.SkipTest("flask_main needs a credentials.ini")
+
+_client = mongomock.MongoClient()
+pymongo.MongoClient = lambda *args, **kwargs: _client
+import flask_main
+
+
+#
+#  GLOBAL VARS
+#
+
+
+# A schedule still to come, so that it hasn't expired
+TODAY = datetime.date.today()
+MONDAY = TODAY + datetime.timedelta(days=7 - TODAY.weekday())
+
+app = flask_main.app
+app.testing = True
+
+
+def create(client_, uid):
+    """ Post /_create for two weeks of 9-5 days from MONDAY """
+    body = { "id": uid, "daterange": "{:%m/%d/%Y} - {:%m/%d/%Y}".format(
+                 MONDAY, MONDAY + datetime.timedelta(days=13)),
+             "begintime": "9:00am", "endtime": "5:00pm",
+             "timezone": "America/Los_Angeles", "weekdays": True }
+    response = client_.post("/_create", data=json.dumps(body),
+                            content_type="application/json")
+    assert json.loads(response.get_data(as_text=True)) is True
+
+
+#
+#  FREE TIMES FEED TESTING
+#
+
+
+def test_free_times_not_modified():
+
+    client_ = app.test_client()
+    create(client_, "feedtest")
+    page = client_.get("/schedule/feedtest").get_data(as_text=True)
+    # The feed as the page gives it to FullCalendar, which then adds
+    # start and end (and, without cache, a _=<time> that changes)
+    feed = re.search(r'events: \{\s*url: "([^"]*)",\s*cache: true', page)
+    assert feed
+    url = "{}?start={}&end={}".format(feed.group(1),
+                                      MONDAY - datetime.timedelta(days=1),
+                                      MONDAY + datetime.timedelta(days=6))
+    first = client_.get(url)
+    assert first.status_code == 200
+    assert len(json.loads(first.get_data(as_text=True))) == 5
+    again = client_.get(url, headers={ "If-None-Match": first.headers["ETag"] })
+    assert again.status_code == 304
+
+
+def test_extreme_bounds():
+
+    client_ = app.test_client()
+    create(client_, "boundtest")
+    # Bounds far outside the schedule are clamped to it
+    bounds = "start=0001-01-01&end=9999-12-31"
+    free = client_.get("/schedule/boundtest/free?" + bounds)
+    assert len(json.loads(free.get_data(as_text=True))) == 10
+    slots = client_.get("/schedule/boundtest/slots?duration=60&" + bounds)
+    assert slots.status_code == 200
+    # Ones before the first year in UTC are turned away
+    bounds = "start=0001-01-01T00:00:00%2B14:00&end=9999-12-31"
+    assert client_.get("/schedule/boundtest/free?" + bounds).status_code == 400
+    assert client_.get("/schedule/boundtest/slots?duration=60&" + bounds).status_code == 400
+
+
+#
+#  METRICS TESTING
+#
+
+
+def test_failed_request_recorded():
+
+    client_ = app.test_client()
+    collection = flask_main.collection
+    class Broken:
+        def find_one(self, *args, **kwargs):
+            raise RuntimeError("Mongo is down")
+    flask_main.collection = Broken()
+    try:
+        client_.get("/schedule/broken/free")
+        assert False, "Expected the exception to reach the test client"
+    except RuntimeError:
+        pass
+    finally:
+        flask_main.collection = collection
+    # Recorded at teardown, which comes even when after_request doesn't
+    assert ('meetme_responses_total{route="/schedule/<unique_id>/free",status="500"} 1.0'
+            in flask_main.METRICS.render())
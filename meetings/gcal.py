@@ -0,0 +1,393 @@
+"""
+Fetching busy times from Google Calendar.
+
+Service objects (and the httplib2 connections under them) are not
+thread safe, so concurrent fetches take a make_service function and
+build one service per worker thread.
+"""
+
+import collections
+import concurrent.futures
+import json
+import logging
+import threading
+import time
+
+import httplib2
+from apiclient import discovery
+from apiclient.errors import HttpError
+
+from times import Chunk, Block, timestamp
+
+log = logging.getLogger(__name__)
+
+# Only the parts of each page that busy_chunks reads
+EVENT_FIELDS = "items(start/dateTime,end/dateTime),nextPageToken"
+
+# What BusyCache needs to apply changes from an incremental sync
+SYNC_FIELDS = ("items(id,status,start/dateTime,end/dateTime),"
+               "nextPageToken,nextSyncToken")
+
+
+# What list_calendars shows of each calendar, and the list's etag
+CALENDAR_FIELDS = "etag,nextPageToken,items(kind,id,summary,selected,primary)"
+
+
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/calendar/v3/rest"
+
+
+class ServiceFactory:
+    """
+    Makes calendar service objects for credentials, doing the costly
+    parts once per process instead of once per request: the discovery
+    document is read (from discovery_file, or fetched from Google on
+    first use) and parsed a single time, and each thread keeps one
+    pool of keep-alive connections to Google that every service it
+    builds shares.  Only the credential binding happens per call.
+    Build times are counted in .builds and .build_seconds.
+    """
+
+    def __init__(self, discovery_file=None):
+        self._document = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.builds = 0
+        self.build_seconds = 0.0
+        if discovery_file:
+            with open(discovery_file) as f:
+                self._document = json.load(f)
+
+
+    def document(self):
+        """ The parsed calendar v3 discovery document """
+        with self._lock:
+            if self._document is None:
+                log.info("Fetching calendar discovery document")
+                resp, content = httplib2.Http().request(DISCOVERY_URL)
+                if resp.status != 200:
+                    raise HttpError(resp, content, uri=DISCOVERY_URL)
+                self._document = json.loads(content.decode("utf-8"))
+            return self._document
+
+
+    def http(self, timeout=None):
+        """
+        A fresh Http (authorize() wraps its request method, so they
+        can't be reused across credentials) sharing this thread's
+        pooled connections
+        """
+        if not hasattr(self._local, "connections"):
+            self._local.connections = { }
+        http = httplib2.Http(timeout=timeout)
+        http.connections = self._local.connections
+        return http
+
+
+    def __call__(self, credentials, timeout=None):
+        start = time.perf_counter()
+        http_auth = credentials.authorize(self.http(timeout))
+        service = discovery.build_from_document(self.document(),
+                                                http=http_auth)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.builds += 1
+            self.build_seconds += elapsed
+        log.debug("Built calendar service in {:.1f}ms".format(elapsed * 1000))
+        return service
+
+
+def event_pages(service, deadline=None, **params):
+    """
+    Generate each page of events().list(**params), following
+    nextPageToken.  The last page is the one carrying nextSyncToken.
+    Past deadline (a time.monotonic() value), raises TimeoutError
+    instead of asking for another page.
+    """
+    page_token = None
+    while True:
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError("Calendar {} not fetched in time".format(
+                params.get("calendarId")))
+        page = service.events().list(pageToken=page_token, **params).execute()
+        yield page
+        page_token = page.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def event_span(event):
+    """
+    (begin, end) epoch seconds of an event, or None for all-day
+    events, which have a date but no dateTime and so don't take up
+    any particular hours
+    """
+    if 'dateTime' not in event.get('start', {}):
+        return None
+    return (timestamp(event['start']['dateTime']),
+            timestamp(event['end']['dateTime']))
+
+
+def busy_chunks(service, cal_id, time_min, time_max, page_size=250,
+                fields=EVENT_FIELDS, deadline=None):
+    """
+    Generate a Chunk for each event in calendar cal_id between
+    time_min and time_max, in start time order, following
+    nextPageToken through every page of results.  Only one page of
+    page_size events (at most 2500) is held at a time, and fields
+    masks the response down to what we use.
+    """
+    pages = event_pages(service, deadline,
+                        calendarId=cal_id, # Calendar selection
+                        timeMin=time_min, # Open time
+                        timeMax=time_max, # Close time
+                        singleEvents=True, # No recurring event selection, fixes no summary index errors
+                        orderBy="startTime", # Order events by startTime
+                        maxResults=page_size,
+                        fields=fields)
+    for page in pages:
+        for event in page.get('items', []):
+            span = event_span(event)
+            if span:
+                yield Chunk(*span)
+
+
+def calendar_block(service, cal_id, time_min, time_max, page_size=250,
+                   deadline=None):
+    """
+    Block of the busy times in calendar cal_id between time_min
+    and time_max
+    """
+    block = Block()
+    for chunk in busy_chunks(service, cal_id, time_min, time_max, page_size,
+                             deadline=deadline):
+        block.append(chunk)
+    return block
+
+
+def calendar_list(service, etag=None, page_size=250):
+    """
+    (items, etag) of the calendars in the user's calendar list,
+    following nextPageToken, with only CALENDAR_FIELDS.  Given the
+    etag of an earlier listing, returns None instead if the list is
+    unchanged since, which Google answers with a bodiless 304.
+    """
+    items = []
+    list_etag = None
+    page_token = None
+    while True:
+        request = service.calendarList().list(pageToken=page_token,
+                                              maxResults=page_size,
+                                              fields=CALENDAR_FIELDS)
+        if etag and page_token is None:
+            request.headers["If-None-Match"] = etag
+        try:
+            page = request.execute()
+        except HttpError as err:
+            if err.resp.status == 304:
+                return None
+            raise
+        if page_token is None:
+            list_etag = page.get("etag")
+        items.extend(page.get("items", []))
+        page_token = page.get("nextPageToken")
+        if not page_token:
+            return items, list_etag
+
+
+class CalendarListCache:
+    """
+    Each user's calendar list, as convert makes it from the listing's
+    items.  Within ttl seconds of being fetched or checked a list is
+    used as it is; after that it is checked with a conditional
+    request, and only fetched and converted again if it has changed.
+    Least recently used users are dropped beyond size.
+    """
+
+    def __init__(self, convert, size=1024, ttl=300, clock=time.monotonic):
+        self._convert = convert
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._size = size
+        self._ttl = ttl
+        self._clock = clock
+        self.hits = 0
+        self.not_modified = 0
+        self.misses = 0
+
+
+    def calendars(self, service, user=None, page_size=250):
+        """
+        user's converted calendar list; not cached without a user.
+        user has to be an identity taken from the credentials service
+        was built with, never one read from a listing, or one
+        account's list can be stored under another's key.
+        """
+        with self._lock:
+            entry = self._entries.get(user) if user else None
+            if entry and self._clock() - entry["checked"] <= self._ttl:
+                self._entries.move_to_end(user)
+                self.hits += 1
+                return entry["calendars"]
+
+        listing = calendar_list(service, entry and entry["etag"], page_size)
+        with self._lock:
+            if listing is None:
+                self.not_modified += 1
+                entry["checked"] = self._clock()
+                return entry["calendars"]
+            self.misses += 1
+        items, etag = listing
+        entry = { "calendars": self._convert(items), "etag": etag,
+                  "checked": self._clock() }
+        if user:
+            with self._lock:
+                self._entries[user] = entry
+                self._entries.move_to_end(user)
+                while len(self._entries) > self._size:
+                    self._entries.popitem(last=False)
+        return entry["calendars"]
+
+
+class BusyCache:
+    """
+    Busy times per (user, calendar, range), kept up to date with
+    Google's incremental sync: the first fetch of a calendar is a full
+    listing that ends with a sync token, and later fetches only ask
+    for the events changed since then.  Entries are dropped after ttl
+    seconds (forcing a full listing again) and, least recently used
+    first, once there are more than size of them.  Safe to share
+    between the threads of fetch_blocks.
+    """
+
+    def __init__(self, size=1024, ttl=3600, clock=time.monotonic):
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._size = size
+        self._ttl = ttl
+        self._clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def stats(self):
+        return { "hits": self.hits, "misses": self.misses,
+                 "evictions": self.evictions, "size": len(self._entries) }
+
+
+    def block(self, service, user, cal_id, time_min, time_max, page_size=250,
+              deadline=None):
+        """
+        Block of the busy times in calendar cal_id between time_min
+        and time_max, as calendar_block gives, from the cache where
+        possible
+        """
+        key = (user, cal_id, timestamp(time_min), timestamp(time_max))
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry and self._clock() - entry["fetched"] > self._ttl:
+                entry = None
+            if entry:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry:
+            try:
+                self._sync(service, entry, key, page_size, deadline,
+                           syncToken=entry["sync_token"])
+            except HttpError as err:
+                # 410 Gone: the sync token has expired
+                if err.resp.status != 410:
+                    raise
+                entry = None
+        if not entry:
+            entry = { "events": { }, "fetched": self._clock() }
+            self._sync(service, entry, key, page_size, deadline,
+                       timeMin=time_min, timeMax=time_max)
+
+        block = Block()
+        for begin, end in entry["events"].values():
+            block.add(begin, end)
+
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return block
+
+
+    def _sync(self, service, entry, key, page_size, deadline=None, **params):
+        """
+        Apply a full or incremental listing of key's calendar to
+        entry's events (id -> span in key's range)
+        """
+        user, cal_id, lo, hi = key
+        events = entry["events"]
+        pages = event_pages(service, deadline, calendarId=cal_id, singleEvents=True,
+                            maxResults=page_size, fields=SYNC_FIELDS,
+                            **params)
+        for page in pages:
+            for event in page.get('items', []):
+                span = None
+                if event.get('status') != 'cancelled':
+                    span = event_span(event)
+                # Incremental syncs report changes anywhere in the
+                # calendar, so keep only events that meet the range
+                if span and span[0] < hi and span[1] > lo:
+                    events[event['id']] = span
+                else:
+                    events.pop(event['id'], None)
+            entry["sync_token"] = page.get('nextSyncToken')
+
+
+def fetch_blocks(make_service, cal_ids, time_min, time_max, workers=8,
+                 page_size=250, cache=None, user=None, executor=None,
+                 timeout=None):
+    """
+    Fetch the busy Block of each calendar in cal_ids concurrently on
+    at most workers threads, yielding (cal_id, block) pairs in the
+    order the fetches finish so callers can start on the interval
+    math while slower calendars are still in flight.  With a
+    BusyCache and the user the calendars belong to, fetches go
+    through the cache.  Given a timeout, each calendar has that many
+    seconds from the start of its fetch to get through all its pages;
+    a single request is bounded by the service's Http timeout.  An
+    exception from any fetch (including either timeout) is raised
+    here, after the outstanding fetches are cancelled.
+
+    Given an executor, fetches run on its threads instead of on a
+    pool made for this call.  A long-lived executor's threads keep
+    their ServiceFactory connections from one call to the next, where
+    a pool per call would open new ones every time.
+    """
+    if executor is None:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            yield from fetch_blocks(make_service, cal_ids, time_min, time_max,
+                                    workers, page_size, cache, user, pool,
+                                    timeout)
+        return
+
+    # One service per thread per call, since each call has its own credentials
+    local = threading.local()
+
+    def fetch(cal_id):
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        if not hasattr(local, "service"):
+            local.service = make_service()
+        if cache is not None and user:
+            return cache.block(local.service, user, cal_id,
+                               time_min, time_max, page_size, deadline)
+        return calendar_block(local.service, cal_id, time_min, time_max,
+                              page_size, deadline)
+
+    futures = { executor.submit(fetch, cal_id): cal_id for cal_id in cal_ids }
+    try:
+        for future in concurrent.futures.as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        for future in futures:
+            future.cancel()
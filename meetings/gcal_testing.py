@@ -0,0 +1,184 @@
+import nose, threading, time
+import concurrent.futures
+from fake_gcal import FakeCalendarService
+from gcal import calendar_block, fetch_blocks, BusyCache, CalendarListCache
+
+
+#
+#  GLOBAL VARS
+#
+
+
+RANGE_BEGIN = "2017-11-16T09:00:00-08:00"
+RANGE_END = "2017-11-23T17:00:00-08:00"
+HOUR = 60 * 60
+MONDAY = 1511197200 # 2017-11-20T09:00:00-08:00
+
+
+def fake_service(events=0):
+    service = FakeCalendarService()
+    service.add_calendar("work", primary=True)
+    for n in range(events):
+        service.add_event("work", MONDAY + n * 2 * HOUR,
+                          MONDAY + n * 2 * HOUR + HOUR)
+    return service
+
+
+#
+#  FETCH TESTING
+#
+
+
+def test_calendar_block_pages():
+
+    service = fake_service(events=7)
+    service.add_event("work", MONDAY - 72 * HOUR, MONDAY, all_day=True)
+    block = calendar_block(service, "work", RANGE_BEGIN, RANGE_END,
+                           page_size=3)
+
+    # Every page read, all-day event ignored
+    assert len(block) == 7
+    assert len(service.requests) == 3
+
+
+def test_fetch_blocks():
+
+    service = fake_service(events=2)
+    service.add_calendar("home")
+    service.add_event("home", MONDAY, MONDAY + 3 * HOUR)
+    fetched = dict(fetch_blocks(lambda: service, ["work", "home"],
+                                RANGE_BEGIN, RANGE_END, workers=2))
+    assert list(fetched["work"].spans()) == [ (MONDAY, MONDAY + HOUR),
+                                              (MONDAY + 2 * HOUR,
+                                               MONDAY + 3 * HOUR) ]
+    assert list(fetched["home"].spans()) == [ (MONDAY, MONDAY + 3 * HOUR) ]
+
+
+def test_fetch_blocks_shared_executor():
+
+    service = fake_service(events=2)
+    threads = set()
+    def make_service():
+        threads.add(threading.current_thread().name)
+        return service
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    for _ in range(3):
+        fetched = dict(fetch_blocks(make_service, ["work"], RANGE_BEGIN,
+                                    RANGE_END, executor=executor))
+        assert len(fetched["work"]) == 2
+    # Every call ran on the executor's one long-lived thread
+    assert len(threads) == 1
+    assert threading.current_thread().name not in threads
+    executor.shutdown()
+
+
+def test_fetch_blocks_deadline():
+
+    service = FakeCalendarService(latency=0.05)
+    service.add_calendar("slow")
+    for n in range(20):
+        service.add_event("slow", MONDAY + n * HOUR, MONDAY + n * HOUR + 60)
+    service.add_calendar("fast", latency=0)
+    start = time.monotonic()
+    try:
+        # One page at a time, the slow calendar needs 20 * 0.05 seconds
+        dict(fetch_blocks(lambda: service, ["slow", "fast"], RANGE_BEGIN,
+                          RANGE_END, workers=2, page_size=1, timeout=0.2))
+        assert False, "Should have timed out"
+    except TimeoutError:
+        pass
+    # Given up between pages, well before the last one
+    assert time.monotonic() - start < 0.5
+    assert len(service.requests) < 10
+
+
+#
+#  CACHE TESTING
+#
+
+
+def test_cache_incremental_sync():
+
+    service = fake_service(events=3)
+    cache = BusyCache()
+    first = cache.block(service, "me", "work", RANGE_BEGIN, RANGE_END)
+    assert len(first) == 3
+    assert service.requests[-1]["syncToken"] is None
+
+    # Only the changes are asked for the second time
+    moved = service.add_event("work", MONDAY + 10 * HOUR, MONDAY + 11 * HOUR)
+    service.add_event("work", MONDAY + 400 * HOUR, MONDAY + 401 * HOUR)
+    second = cache.block(service, "me", "work", RANGE_BEGIN, RANGE_END)
+    assert service.requests[-1]["syncToken"] is not None
+    assert list(second.spans())[-1] == (MONDAY + 10 * HOUR,
+                                        MONDAY + 11 * HOUR)
+    assert len(second) == 4
+
+    service.delete_event("work", moved)
+    assert len(cache.block(service, "me", "work", RANGE_BEGIN, RANGE_END)) == 3
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_expired_sync_token():
+
+    service = fake_service(events=3)
+    cache = BusyCache()
+    cache.block(service, "me", "work", RANGE_BEGIN, RANGE_END)
+    service.add_event("work", MONDAY + 10 * HOUR, MONDAY + 11 * HOUR)
+    service.expire_sync_tokens()
+
+    # 410 Gone falls back to a full listing
+    block = cache.block(service, "me", "work", RANGE_BEGIN, RANGE_END)
+    assert len(block) == 4
+    assert service.requests[-1]["syncToken"] is None
+
+
+def test_cache_ttl_and_eviction():
+
+    now = [ 0 ]
+    service = fake_service(events=1)
+    cache = BusyCache(size=1, ttl=60, clock=lambda: now[0])
+    cache.block(service, "me", "work", RANGE_BEGIN, RANGE_END)
+    now[0] = 61
+    cache.block(service, "me", "work", RANGE_BEGIN, RANGE_END)
+    assert cache.stats()["misses"] == 2
+
+    cache.block(service, "you", "work", RANGE_BEGIN, RANGE_END)
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size"] == 1
+
+
+#
+#  CALENDAR LIST TESTING
+#
+
+
+def test_calendar_list_cache():
+
+    service = fake_service()
+    for n in range(4):
+        service.add_calendar("cal{}".format(n))
+    now = [ 0 ]
+    cache = CalendarListCache(lambda items: sorted(cal["id"] for cal in items),
+                              ttl=60, clock=lambda: now[0])
+    ids = [ "cal0", "cal1", "cal2", "cal3", "work" ]
+    assert cache.calendars(service, "work", page_size=2) == ids
+    # Every page was followed
+    assert len(service.requests) == 3
+
+    # Within the TTL nothing is asked of Google
+    assert cache.calendars(service, "work") == ids
+    assert len(service.requests) == 3
+
+    # After it, an unchanged list costs one 304
+    now[0] = 61
+    assert cache.calendars(service, "work") == ids
+    assert len(service.requests) == 4
+    assert service.requests[-1]["ifNoneMatch"] is not None
+
+    # and a changed one is fetched again
+    now[0] = 122
+    service.add_calendar("cal4")
+    assert cache.calendars(service, "work") == ids[:4] + [ "cal4", "work" ]
+    assert (cache.hits, cache.not_modified, cache.misses) == (1, 1, 2)
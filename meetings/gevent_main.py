@@ -0,0 +1,34 @@
+"""
+Serve the app on gevent, so Google-bound requests don't each hold a
+worker while they wait.
+
+    python3 gevent_main.py
+
+/choose and /_events spend nearly all their time waiting on Google
+(and a little on Mongo).  With the standard library monkey patched
+before anything else is imported, every request, and every thread
+fetch_blocks starts, is a greenlet that yields whenever it waits on
+a socket, so one process holds hundreds of calendar fetches in flight
+where a sync worker holds one request.  FETCH_WORKERS can then be
+raised well beyond what real threads would allow (though TIMES_ENGINE
+= parallel then works in process; see times_parallel).  The URLs,
+templates and code are flask_main's; under gunicorn the same is had
+with --worker-class gevent.
+"""
+
+from gevent import monkey
+monkey.patch_all()
+
+from gevent.pywsgi import WSGIServer
+
+import flask_main
+
+
+def main():
+    server = WSGIServer(("0.0.0.0", flask_main.CONFIG.PORT), flask_main.app)
+    print("Serving on port {} with gevent".format(flask_main.CONFIG.PORT))
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
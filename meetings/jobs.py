@@ -0,0 +1,67 @@
+"""
+Background jobs, recorded in a Mongo collection and run on a thread
+pool in this process.
+
+The collection stands in for a real broker: each job is a document
+with its status (queued, running, done or failed), so any worker can
+answer a status poll, and the pool does the work off the request
+path.  Jobs don't survive the process that queued them; ones left
+queued or running by a process that died stay that way until the TTL
+index removes them.
+"""
+
+import concurrent.futures
+import datetime
+import logging
+import traceback
+import uuid
+
+log = logging.getLogger(__name__)
+
+# Fields a status poll is answered with
+STATUS_FIELDS = { "_id": 0, "kind": 1, "status": 1, "error": 1,
+                  "created": 1, "finished": 1 }
+
+
+class JobQueue:
+
+    def __init__(self, collection, workers=4, ttl_days=1):
+        self._collection = collection
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        collection.create_index("created",
+                                expireAfterSeconds=ttl_days * 24 * 60 * 60)
+
+
+    def submit(self, kind, func, *args, **kwargs):
+        """
+        Queue func(*args, **kwargs) as a job of the given kind and
+        return its id at once
+        """
+        job_id = uuid.uuid4().hex
+        self._collection.insert_one({ "_id": job_id, "kind": kind,
+                                      "status": "queued",
+                                      "created": datetime.datetime.utcnow() })
+        self._pool.submit(self._run, job_id, func, args, kwargs)
+        return job_id
+
+
+    def status(self, job_id):
+        """ The job's document (STATUS_FIELDS), or None if there is no such job """
+        return self._collection.find_one({ "_id": job_id }, STATUS_FIELDS)
+
+
+    def _run(self, job_id, func, args, kwargs):
+        self._set(job_id, status="running")
+        try:
+            func(*args, **kwargs)
+        except Exception as err:
+            log.error("Job {} failed:\n{}".format(job_id, traceback.format_exc()))
+            self._set(job_id, status="failed", error=str(err),
+                      finished=datetime.datetime.utcnow())
+        else:
+            self._set(job_id, status="done",
+                      finished=datetime.datetime.utcnow())
+
+
+    def _set(self, job_id, **fields):
+        self._collection.update_one({ "_id": job_id }, { "$set": fields })
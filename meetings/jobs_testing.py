@@ -0,0 +1,51 @@
+import nose, threading, time
+import mongomock
+from jobs import JobQueue
+
+
+#
+#  JOB TESTING
+#
+
+
+def wait(queue, job_id):
+    for _ in range(100):
+        job = queue.status(job_id)
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    assert False, "Job {} didn't finish".format(job_id)
+
+
+def test_job_runs_off_request_path():
+
+    queue = JobQueue(mongomock.MongoClient().db.jobs, workers=2)
+    started = threading.Event()
+    release = threading.Event()
+    results = []
+
+    def work(value):
+        started.set()
+        release.wait(5)
+        results.append(value)
+
+    job_id = queue.submit("events", work, 42)
+    started.wait(5)
+    # submit returned while the job was still going
+    assert queue.status(job_id)["status"] == "running"
+    release.set()
+    assert wait(queue, job_id)["status"] == "done"
+    assert results == [ 42 ]
+    assert queue.status("nosuchjob") is None
+
+
+def test_failed_job():
+
+    queue = JobQueue(mongomock.MongoClient().db.jobs)
+
+    def fail():
+        raise ValueError("No such calendar")
+
+    job = wait(queue, queue.submit("events", fail))
+    assert job["status"] == "failed"
+    assert job["error"] == "No such calendar"
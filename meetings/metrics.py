@@ -0,0 +1,188 @@
+"""
+Counters, gauges and timers for the app's hot paths, exported in the
+Prometheus text format, plus optional cProfile sampling of requests.
+
+Timers are histograms of seconds.  With a Metrics made disabled,
+count and observe return at once and timer hands back a shared no-op
+context manager, so instrumented code costs a method call per stage.
+"""
+
+import collections
+import cProfile
+import itertools
+import os
+import threading
+import time
+
+
+# Upper bounds (seconds) of the histogram buckets timers fill
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class _NullTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+
+    __slots__ = ("_metrics", "_name", "_labels", "_start")
+
+    def __init__(self, metrics, name, labels):
+        self._metrics = metrics
+        self._name = name
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metrics.observe(self._name, time.perf_counter() - self._start,
+                              **self._labels)
+        return False
+
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace('"', '\\"'))
+                          for k, v in pairs) + "}"
+
+
+class Metrics:
+    """
+    Registry of named series, each keyed by its labels.  Names are
+    given without prefix, which is added when rendering.  Safe to use
+    from any thread.
+    """
+
+    def __init__(self, enabled=True, prefix="meetme_"):
+        self.enabled = enabled
+        self._prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = collections.defaultdict(float)
+        self._gauges = { }
+        self._histograms = { }
+
+
+    def count(self, name, value=1, **labels):
+        """ Add value to counter name """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+
+    def total(self, name, value, **labels):
+        """
+        Set counter name to value, a running total kept elsewhere (such
+        as a cache's hit count); it should only ever go up
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = value
+
+
+    def gauge(self, name, value, **labels):
+        """ Set gauge name to value """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+
+    def observe(self, name, seconds, **labels):
+        """ Record seconds in histogram name """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Bucket counts, then the count and sum of everything
+                histogram = self._histograms[key] = [ 0 ] * len(BUCKETS) + [ 0, 0.0 ]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += 1
+            histogram[-1] += seconds
+
+
+    def timer(self, name, **labels):
+        """ Context manager recording the seconds it was open in name """
+        if not self.enabled:
+            return NULL_TIMER
+        return _Timer(self, name, labels)
+
+
+    def render(self):
+        """ Every series in the Prometheus text exposition format """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted((key, list(value))
+                                for key, value in self._histograms.items())
+        lines = []
+        for kind, series in (("counter", counters), ("gauge", gauges)):
+            for name, group in itertools.groupby(series, lambda item: item[0][0]):
+                name = self._prefix + name
+                lines.append("# TYPE {} {}".format(name, kind))
+                for (_, labels), value in group:
+                    lines.append("{}{} {}".format(name, _label_text(labels), value))
+        for name, group in itertools.groupby(histograms, lambda item: item[0][0]):
+            name = self._prefix + name
+            lines.append("# TYPE {} histogram".format(name))
+            for (_, labels), histogram in group:
+                for bound, count in zip(BUCKETS, histogram):
+                    lines.append("{}_bucket{} {}".format(
+                        name, _label_text(labels, [("le", bound)]), count))
+                lines.append("{}_bucket{} {}".format(
+                    name, _label_text(labels, [("le", "+Inf")]), histogram[-2]))
+                lines.append("{}_sum{} {}".format(name, _label_text(labels), histogram[-1]))
+                lines.append("{}_count{} {}".format(name, _label_text(labels), histogram[-2]))
+        return "\n".join(lines) + "\n"
+
+
+class Sampler:
+    """
+    Profiles one request in every `every` with cProfile, writing each
+    profile to directory as <name>-<n>.prof for pstats or snakeviz
+    """
+
+    def __init__(self, every, directory="."):
+        self._every = every
+        self._directory = directory
+        self._requests = itertools.count(1)
+
+
+    def start(self):
+        """ A running profiler if this request is to be sampled, or None """
+        n = next(self._requests)
+        if n % self._every:
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        profile.number = n
+        return profile
+
+
+    def stop(self, profile, name):
+        profile.disable()
+        path = os.path.join(self._directory, "{}-{}.prof".format(
+            name.strip("/").replace("/", "_").replace("<", "").replace(">", "") or "index",
+            profile.number))
+        profile.dump_stats(path)
+        return path
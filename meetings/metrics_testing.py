@@ -0,0 +1,53 @@
+import nose, os, tempfile
+from metrics import Metrics, Sampler, NULL_TIMER
+
+
+#
+#  METRICS TESTING
+#
+
+
+def test_render():
+
+    registry = Metrics()
+    registry.count("calendars_fetched_total", 3)
+    registry.count("responses_total", route="/_events", status=200)
+    registry.gauge("busy_cache_size", 7)
+    registry.total("busy_cache_hits_total", 5)
+    registry.total("busy_cache_hits_total", 9)
+    registry.observe("request_seconds", 0.02, route="/_events")
+    registry.observe("request_seconds", 3, route="/_events")
+    lines = registry.render().splitlines()
+    assert "# TYPE meetme_calendars_fetched_total counter" in lines
+    assert "meetme_calendars_fetched_total 3.0" in lines
+    assert 'meetme_responses_total{route="/_events",status="200"} 1.0' in lines
+    assert "meetme_busy_cache_size 7" in lines
+    # Totals kept elsewhere are counters, set rather than added to
+    assert "# TYPE meetme_busy_cache_hits_total counter" in lines
+    assert "meetme_busy_cache_hits_total 9" in lines
+    assert "# TYPE meetme_request_seconds histogram" in lines
+    assert 'meetme_request_seconds_bucket{route="/_events",le="0.01"} 0' in lines
+    assert 'meetme_request_seconds_bucket{route="/_events",le="0.025"} 1' in lines
+    assert 'meetme_request_seconds_bucket{route="/_events",le="+Inf"} 2' in lines
+    assert 'meetme_request_seconds_count{route="/_events"} 2' in lines
+
+
+def test_disabled():
+
+    registry = Metrics(enabled=False)
+    assert registry.timer("request_seconds") is NULL_TIMER
+    with registry.timer("request_seconds"):
+        registry.count("calendars_fetched_total")
+    assert registry.render() == "\n"
+
+
+def test_sampler():
+
+    directory = tempfile.mkdtemp()
+    sampler = Sampler(2, directory)
+    assert sampler.start() is None
+    profile = sampler.start()
+    sum(range(1000))
+    path = sampler.stop(profile, "/schedule/<unique_id>")
+    assert os.path.basename(path) == "schedule_unique_id-2.prof"
+    assert os.path.exists(path)
@@ -0,0 +1,297 @@
+"""
+Schedule documents in the schedules collection.
+
+A schedule document holds the recurrence its daily windows follow
+("rule", see windows.DailyRule), its overall "range", the IANA
+"timezone" its windows are in, and for each
+participant who has submitted calendars, that participant's merged
+busy times ("busy").  Busy times are stored compactly as a flat list
+of epoch seconds [begin, end, begin, end, ...].  Submitting is done
+with conditional single-document updates (see submit_busy), so
+concurrent participants never lose each other's times; free times are worked
+out when the schedule is read, and memoized until its "version"
+counter moves on.  Documents from before rules were stored list each
+day's window in "times" (ISO begin/end dicts) instead.
+"""
+
+from bisect import bisect_right
+import collections
+import datetime
+import itertools
+import threading
+
+import slots
+from times import Chunk, Block, timestamp
+from windows import UTC, DailyRule, get_tz, isoformat
+
+
+# Fields of a schedule document each reader needs
+FREE_FIELDS = { "_id": 0, "range": 1, "rule": 1, "times": 1, "busy": 1,
+                "version": 1, "timezone": 1 }
+RANGE_FIELDS = { "_id": 0, "range": 1 }
+# What a conditional request is answered from
+HEAD_FIELDS = { "_id": 0, "version": 1, "updated": 1, "created": 1,
+                "timezone": 1 }
+
+
+def ensure_indexes(collection):
+    """
+    Indexes for the schedules collection: a unique index on uid, which
+    every lookup uses, and a TTL index that has Mongo delete schedules
+    once their "expires" time has passed.  Documents without one (made
+    before it was stored) are kept.  The TTL index on "created" that
+    came before it is dropped, since it deleted schedules whose range
+    was still to come.
+    """
+    collection.create_index("uid", unique=True)
+    if "created_1" in collection.index_information():
+        collection.drop_index("created_1")
+    collection.create_index("expires", expireAfterSeconds=0)
+
+
+def new_document(uid, timezone, rule, ttl_days=180):
+    """
+    Schedule document for a schedule just created from a DailyRule,
+    expiring ttl_days after its range ends
+    """
+    now = datetime.datetime.utcnow()
+    last = rule.last()
+    expires = (last.astimezone(UTC).replace(tzinfo=None)
+               + datetime.timedelta(days=ttl_days))
+    return { "type": "schedule", "uid": uid, "timezone": timezone,
+             "range": { "begin": rule.first().isoformat(),
+                        "end": last.isoformat() },
+             "rule": rule.to_db(), "busy": [ ], "version": 0,
+             "created": now, "updated": now, "expires": expires }
+
+
+def last_modified(head):
+    """
+    Naive UTC datetime a schedule last changed at, from a document
+    read with HEAD_FIELDS, or None if it doesn't say
+    """
+    return head.get("updated") or head.get("created")
+
+
+def block_to_db(block, tzinfo=UTC):
+    """
+    List of ISO begin/end dicts (in tzinfo) for a Block's spans;
+    the only place free times are turned back into text.
+    """
+    result = []
+    for begin, end in block.spans():
+        result.append({'begin': isoformat(begin, tzinfo),
+                       'end': isoformat(end, tzinfo)})
+    return result
+
+
+def db_to_block(arr):
+    """
+    Block from a list of ISO begin/end dicts, parsed straight to
+    epoch seconds
+    """
+    block = Block()
+    for time in arr:
+        block.add(timestamp(time['begin']), timestamp(time['end']))
+    return block
+
+
+def pack(block):
+    """ Flat [begin, end, begin, end, ...] list of a Block's spans """
+    return list(itertools.chain.from_iterable(block.spans()))
+
+
+def unpack(flat):
+    """ Block from a list made by pack """
+    return Block.from_sorted(flat[0::2], flat[1::2])
+
+
+def busy_at(document, ts):
+    """
+    Participants of a schedule document who are busy at epoch second
+    ts.  A packed list is sorted, so ts falls inside a span exactly
+    when an odd number of its values are at or before ts.
+    """
+    return [ entry["participant"] for entry in document.get("busy", [])
+             if bisect_right(entry["spans"], ts) % 2 ]
+
+
+def busy_entry(participant, block):
+    """ Element of a schedule's "busy" list for participant's busy times """
+    return { "participant": participant, "spans": pack(block) }
+
+
+def submit_busy(collection, uid, participant, block, retries=10):
+    """
+    Add block to participant's busy times on schedule uid and bump its
+    version (and "updated" time).  Each attempt is a single atomic update that only applies
+    if the participant's entry is still what it was read as (or still
+    absent), so submits from any number of participants at once all
+    land, and a participant racing with their own earlier submit just
+    retries with the newer entry.  Returns False if there is no such
+    schedule.
+    """
+    for attempt in range(retries):
+        document = collection.find_one(
+            { "uid": uid },
+            { "busy": { "$elemMatch": { "participant": participant } } })
+        if document is None:
+            return False
+        if document.get("busy"):
+            spans = document["busy"][0]["spans"]
+            merged = unpack(spans).union(block)
+            result = collection.update_one(
+                { "uid": uid,
+                  "busy": { "$elemMatch": { "participant": participant,
+                                            "spans": spans } } },
+                { "$set": { "busy.$.spans": pack(merged),
+                            "updated": datetime.datetime.utcnow() },
+                  "$inc": { "version": 1 } })
+        else:
+            result = collection.update_one(
+                { "uid": uid, "busy.participant": { "$ne": participant } },
+                { "$push": { "busy": busy_entry(participant, block) },
+                  "$set": { "updated": datetime.datetime.utcnow() },
+                  "$inc": { "version": 1 } })
+        if result.matched_count:
+            return True
+    raise RuntimeError("Gave up submitting busy times for {} on {}".format(
+        participant, uid))
+
+
+def union_blocks(blocks, engine="block"):
+    """
+    Block of the times covered by any of blocks, with times.Block or,
+    if engine is "numpy", times_numpy
+    """
+    if engine == "numpy":
+        import times_numpy
+        return times_numpy.union_block(blocks)
+    result = Block()
+    for block in blocks:
+        result = result.union(block)
+    return result
+
+
+def windows_block(document, lo=None, hi=None):
+    """
+    Block of a schedule document's daily windows, only expanding its
+    rule over the days that meet lo..hi (epoch seconds) if given
+    """
+    if "rule" not in document:
+        return db_to_block(document["times"])
+    rule = DailyRule.from_db(document["rule"], get_tz(document["timezone"]))
+    return Block.from_spans(rule.windows(lo, hi))
+
+
+def range_chunk(document, lo=None, hi=None):
+    """ Chunk of a schedule document's range, within lo..hi if given """
+    span = Chunk(document["range"]["begin"], document["range"]["end"])
+    if lo is not None:
+        span.begin_ts = max(span.begin_ts, lo)
+    if hi is not None:
+        span.end_ts = min(span.end_ts, hi)
+    return span
+
+
+def free_block(document, engine="block", lo=None, hi=None):
+    """
+    Block of the free times of a schedule document: its daily windows
+    less every participant's busy times, within lo..hi (epoch
+    seconds) if given.  engine is as for union_blocks, or "parallel"
+    to work it out a week at a time across processes (times_parallel).
+    """
+    windows = windows_block(document, lo, hi)
+    span = range_chunk(document, lo, hi)
+    if engine == "parallel":
+        import times_parallel
+        return times_parallel.free_block(
+            windows, [ entry["spans"] for entry in document.get("busy", []) ],
+            span.begin_ts, span.end_ts)
+    busy = union_blocks([ unpack(entry["spans"])
+                          for entry in document.get("busy", []) ], engine)
+    return windows.intersect(busy.complement(span))
+
+
+def best_slots(document, duration, granularity, k=5, preferred=None,
+               lo=None, hi=None, default_timezone="UTC", engine="block"):
+    """
+    Up to k (begin, end, free) meetings of duration seconds, starting
+    every granularity seconds through each of a schedule document's
+    windows (within lo..hi if given), ranked by how many participants
+    are free for all of them; see slots.best_slots.  preferred is an
+    optional ((hour, minute), (hour, minute)) time of day that
+    meetings must fall within.  engine "parallel" works through the
+    range a week at a time across processes (times_parallel).
+    """
+    windows = windows_block(document, lo, hi)
+    if preferred:
+        tzinfo = get_tz(document.get("timezone", default_timezone))
+        day = lambda text: datetime.date(*map(int, text[:10].split("-")))
+        hours = DailyRule(day(document["range"]["begin"]),
+                          day(document["range"]["end"]),
+                          preferred[0], preferred[1], tzinfo)
+        windows = windows.intersect(Block.from_spans(hours.windows(lo, hi)))
+    span = range_chunk(document, lo, hi)
+    if engine == "parallel":
+        import times_parallel
+        return times_parallel.best_slots(
+            windows, [ entry["spans"] for entry in document.get("busy", []) ],
+            span.begin_ts, span.end_ts, duration, granularity, k)
+    free_blocks = [ unpack(entry["spans"]).complement(span)
+                    for entry in document.get("busy", []) ]
+    return slots.best_slots(windows, free_blocks, duration, granularity, k)
+
+
+class FreeTimes:
+    """
+    Memo of schedules' free times, keyed by uid and the window asked
+    for, and good for as long as the document's version is unchanged.
+    A lookup that hits costs one read of the version field (none if
+    the caller has already read it); a miss reads the whole document.
+    Least recently used entries are dropped beyond size of them.
+    Schedules from before time zones were recorded are taken to be in
+    default_timezone.
+    """
+
+    def __init__(self, size=256, engine="block", default_timezone="UTC"):
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._size = size
+        self._engine = engine
+        self._default_timezone = default_timezone
+        self.hits = 0
+        self.misses = 0
+
+
+    def lookup(self, collection, uid, lo=None, hi=None, head=None):
+        """
+        (free Block, tzinfo) of schedule uid, within lo..hi (epoch
+        seconds) if given, or None if there is no such schedule.
+        head is the document as read with HEAD_FIELDS, if the caller
+        has it.
+        """
+        if head is None:
+            head = collection.find_one({ "uid": uid }, { "version": 1 })
+            if head is None:
+                return None
+        key = (uid, lo, hi)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached and cached[0] == head.get("version", 0):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[1:]
+            self.misses += 1
+
+        document = collection.find_one({ "uid": uid }, FREE_FIELDS)
+        if document is None:
+            return None
+        block = free_block(document, self._engine, lo, hi)
+        tzinfo = get_tz(document.get("timezone", self._default_timezone))
+        with self._lock:
+            self._entries[key] = (document.get("version", 0), block, tzinfo)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+        return block, tzinfo
@@ -0,0 +1,85 @@
+"""
+Lookup latency for the schedules collection at scale.
+
+    python3 schedules_benchmark.py --mongo URL [--documents N]
+
+Fills a scratch database on the given mongod with N (default 1M)
+schedule documents, then times find_one by uid, as schedule() and
+events() do, with and without the indexes from
+schedules.ensure_indexes and with and without the field projections.
+Needs a real mongod; the scratch database is dropped afterwards.
+"""
+
+import argparse
+import datetime
+import random
+import time
+
+from pymongo import MongoClient
+
+import schedules
+import windows
+
+
+def fill(collection, n, batch=10000):
+    # Two weeks of 9-5 days from 11/20/2017
+    rule = windows.DailyRule(datetime.date(2017, 11, 20), datetime.date(2017, 12, 3),
+                             (9, 0), (17, 0), windows.get_tz("America/Los_Angeles"))
+    for start in range(0, n, batch):
+        collection.insert_many([
+            schedules.new_document("uid{:09d}".format(i), "America/Los_Angeles", rule)
+            for i in range(start, min(start + batch, n)) ], ordered=False)
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda p: samples[min(len(samples) - 1, int(p * len(samples)))]
+    return pick(0.5) * 1000, pick(0.95) * 1000, pick(0.99) * 1000
+
+
+def time_lookups(collection, n, lookups, projection=None):
+    rand = random.Random(322)
+    samples = []
+    for _ in range(lookups):
+        uid = "uid{:09d}".format(rand.randrange(n))
+        start = time.perf_counter()
+        collection.find_one({ "uid": uid }, projection)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Schedules lookup benchmark")
+    parser.add_argument("--mongo", required=True, help="mongod URL")
+    parser.add_argument("--documents", type=int, default=1000000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--unindexed-lookups", type=int, default=20,
+                        help="Lookups to time without indexes (each is a scan)")
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo)
+    db = client.meetme_benchmark
+    collection = db.schedules
+    collection.drop()
+    print("Inserting {} documents".format(args.documents))
+    fill(collection, args.documents)
+
+    print("{:<28} {:>10} {:>10} {:>10}".format("lookup", "p50 ms", "p95 ms", "p99 ms"))
+    row = "{:<28} {:>10.3f} {:>10.3f} {:>10.3f}"
+    print(row.format("no index",
+                     *time_lookups(collection, args.documents,
+                                   args.unindexed_lookups)))
+    schedules.ensure_indexes(collection)
+    print(row.format("uid index",
+                     *time_lookups(collection, args.documents, args.lookups)))
+    print(row.format("uid index, FREE_FIELDS",
+                     *time_lookups(collection, args.documents, args.lookups,
+                                   schedules.FREE_FIELDS)))
+    print(row.format("uid index, RANGE_FIELDS",
+                     *time_lookups(collection, args.documents, args.lookups,
+                                   schedules.RANGE_FIELDS)))
+    client.drop_database(db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Load test for concurrent busy-time submits on one schedule.
+
+    python3 schedules_loadtest.py [--participants N] [--submits K]
+                                  [--threads T] [--mongo URL]
+
+Creates a schedule, then has N participants each submit K batches of
+random busy times, all at once on T threads, the way colleagues do
+after a schedule link is shared.  Runs against mongomock unless a
+mongod URL is given.  Checks that every participant ended up with
+exactly one entry holding all of their batches, that the version
+counted every submit, and that the free times are what the same
+submits give when applied one at a time.
+"""
+
+import argparse
+import concurrent.futures
+import random
+import threading
+import time
+
+import mongomock
+from pymongo import MongoClient
+
+import schedules
+from times import Block
+
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+MONDAY = 1511197200 # 2017-11-20T09:00:00-08:00
+
+
+class AtomicCollection:
+    """
+    mongomock collection whose operations run one at a time, as
+    mongod applies each single-document update atomically.  mongomock
+    on its own matches and then modifies without a lock, so threads
+    would see races real Mongo doesn't have.
+    """
+
+    def __init__(self, collection):
+        self._collection = collection
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+        def locked(*args, **kwargs):
+            with self._lock:
+                return method(*args, **kwargs)
+        return locked
+
+
+def new_schedule(collection, uid, days=5):
+    collection.insert_one({
+        "type": "schedule", "uid": uid,
+        "range": { "begin": MONDAY, "end": MONDAY + (days - 1) * DAY + 8 * HOUR },
+        "times": [ { "begin": MONDAY + d * DAY, "end": MONDAY + d * DAY + 8 * HOUR }
+                   for d in range(days) ],
+        "busy": [ ], "version": 0 })
+
+
+def random_busy(rand, days=5):
+    block = Block()
+    for _ in range(rand.randint(0, 6)):
+        begin = MONDAY + rand.randint(0, days - 1) * DAY + rand.randint(0, 32) * 15 * 60
+        block.add(begin, begin + rand.randint(1, 8) * 15 * 60)
+    return block
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent submit load test")
+    parser.add_argument("--participants", type=int, default=200)
+    parser.add_argument("--submits", type=int, default=3,
+                        help="Submits per participant")
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--mongo", help="mongod URL (default: mongomock)")
+    args = parser.parse_args()
+
+    if args.mongo:
+        collection = MongoClient(args.mongo).meetme_loadtest.schedules
+    else:
+        collection = AtomicCollection(
+            mongomock.MongoClient().meetme_loadtest.schedules)
+    uid = "loadtest-{}".format(int(time.time()))
+    new_schedule(collection, uid)
+
+    rand = random.Random(322)
+    submits = [ ("p{}@example.com".format(p), random_busy(rand))
+                for p in range(args.participants)
+                for _ in range(args.submits) ]
+    rand.shuffle(submits)
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(args.threads) as pool:
+        list(pool.map(lambda s: schedules.submit_busy(collection, uid, *s),
+                      submits))
+    elapsed = time.perf_counter() - start
+
+    document = collection.find_one({ "uid": uid })
+    expected = { }
+    for participant, block in submits:
+        expected[participant] = expected.get(participant, Block()).union(block)
+    stored = { entry["participant"]: entry["spans"] for entry in document["busy"] }
+    assert len(document["busy"]) == args.participants
+    assert document["version"] == len(submits)
+    for participant, block in expected.items():
+        assert stored[participant] == schedules.pack(block)
+    sequential = dict(document, busy=[ schedules.busy_entry(p, b)
+                                       for p, b in expected.items() ])
+    assert (list(schedules.free_block(document).spans()) ==
+            list(schedules.free_block(sequential).spans()))
+
+    print("{} submits from {} participants on {} threads: {:.2f}s, {:.0f}/s".format(
+        len(submits), args.participants, args.threads, elapsed,
+        len(submits) / elapsed))
+    print("All submits landed; free times match sequential submits")
+    collection.delete_one({ "uid": uid })
+
+
+if __name__ == "__main__":
+    main()
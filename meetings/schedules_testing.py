@@ -0,0 +1,158 @@
+import nose, copy, datetime, random
+import mongomock
+from times import Block
+from schedules import pack, unpack, busy_at, busy_entry, free_block, submit_busy, FreeTimes
+from schedules import best_slots
+from schedules import block_to_db, db_to_block
+from schedules import ensure_indexes, new_document
+from windows import UTC, DailyRule, get_tz
+
+
+#
+#  GLOBAL VARS
+#
+
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+MONDAY = 1511197200 # 2017-11-20T09:00:00-08:00
+
+# Two 9-5 days, as created by /_create
+document = { "uid": "limo8tyfd5",
+             "timezone": "America/Los_Angeles",
+             "range": { "begin": "2017-11-20T09:00:00-08:00",
+                        "end": "2017-11-21T17:00:00-08:00" },
+             "rule": { "begin_date": "2017-11-20", "end_date": "2017-11-21",
+                       "begin_time": [ 9, 0 ], "end_time": [ 17, 0 ],
+                       "weekdays_only": False, "exclude": [ ] },
+             "busy": [ ],
+             "version": 0 }
+
+# The same schedule as stored before rules, one window per day
+listed = dict(((key, value) for key, value in document.items() if key != "rule"),
+              times=[ { "begin": "2017-11-20T09:00:00-08:00",
+                        "end": "2017-11-20T17:00:00-08:00" },
+                      { "begin": "2017-11-21T09:00:00-08:00",
+                        "end": "2017-11-21T17:00:00-08:00" } ])
+
+
+#
+#  DOCUMENT TESTING
+#
+
+
+def test_pack():
+
+    block = Block()
+    block.add(MONDAY, MONDAY + HOUR)
+    block.add(MONDAY + DAY, MONDAY + DAY + 2 * HOUR)
+    assert pack(block) == [ MONDAY, MONDAY + HOUR,
+                            MONDAY + DAY, MONDAY + DAY + 2 * HOUR ]
+    assert list(unpack(pack(block)).spans()) == list(block.spans())
+
+
+def test_expires_after_range():
+
+    tzinfo = get_tz("America/Los_Angeles")
+    rule = DailyRule(datetime.date(2017, 11, 20), datetime.date(2018, 11, 21),
+                     (9, 0), (17, 0), tzinfo)
+    doc = new_document("limo8tyfd5", "America/Los_Angeles", rule, ttl_days=30)
+    # 30 days after the range's last window closes, in naive UTC
+    assert doc["expires"] == datetime.datetime(2018, 12, 22, 1, 0)
+
+    collection = mongomock.MongoClient().db.schedules
+    collection.create_index("created", expireAfterSeconds=60)
+    ensure_indexes(collection)
+    indexes = collection.index_information()
+    assert "created_1" not in indexes
+    assert indexes["expires_1"]["expireAfterSeconds"] == 0
+
+
+def test_db_round_trip():
+
+    rand = random.Random(11)
+    for case in range(100):
+        block = Block()
+        for _ in range(rand.randint(0, 10)):
+            begin = MONDAY + 60 * rand.randint(0, 10000)
+            block.add(begin, begin + 60 * rand.randint(1, 300))
+        for tzinfo in (UTC, get_tz("America/Los_Angeles")):
+            stored = block_to_db(block, tzinfo)
+            assert list(db_to_block(stored).spans()) == list(block.spans()), case
+        assert list(unpack(pack(block)).spans()) == list(block.spans()), case
+
+
+def test_free_block():
+
+    assert list(free_block(document).spans()) == [
+        (MONDAY, MONDAY + 8 * HOUR), (MONDAY + DAY, MONDAY + DAY + 8 * HOUR) ]
+    assert list(free_block(listed).spans()) == list(free_block(document).spans())
+    # Only the part within lo..hi
+    assert list(free_block(document, lo=MONDAY + DAY + HOUR).spans()) == [
+        (MONDAY + DAY + HOUR, MONDAY + DAY + 8 * HOUR) ]
+
+    first, second = Block(), Block()
+    first.add(MONDAY + HOUR, MONDAY + 2 * HOUR)
+    second.add(MONDAY + 90 * 60, MONDAY + 3 * HOUR)
+    second.add(MONDAY + DAY - HOUR, MONDAY + DAY + HOUR)
+    submitted = dict(document, busy=[ busy_entry("a@example.com", first),
+                                      busy_entry("b@example.com", second) ])
+    expected = [ (MONDAY, MONDAY + HOUR),
+                 (MONDAY + 3 * HOUR, MONDAY + 8 * HOUR),
+                 (MONDAY + DAY + HOUR, MONDAY + DAY + 8 * HOUR) ]
+    assert list(free_block(submitted).spans()) == expected
+    assert list(free_block(submitted, "numpy").spans()) == expected
+    assert list(free_block(submitted, "parallel").spans()) == expected
+    assert (best_slots(submitted, HOUR, 30 * 60, 4, engine="parallel")
+            == best_slots(submitted, HOUR, 30 * 60, 4))
+    assert busy_at(submitted, MONDAY + 100 * 60) == [ "a@example.com", "b@example.com" ]
+    assert busy_at(submitted, MONDAY + 2 * HOUR) == [ "b@example.com" ]
+    assert busy_at(submitted, MONDAY + 3 * HOUR) == [ ]
+
+
+def test_submit_busy():
+
+    collection = mongomock.MongoClient().db.schedules
+    collection.insert_one(copy.deepcopy(document))
+    first, second = Block(), Block()
+    first.add(MONDAY, MONDAY + HOUR)
+    second.add(MONDAY + HOUR, MONDAY + 2 * HOUR)
+
+    assert submit_busy(collection, "limo8tyfd5", "a@example.com", first)
+    assert submit_busy(collection, "limo8tyfd5", "b@example.com", first)
+    # A second submit adds to the participant's busy times
+    assert submit_busy(collection, "limo8tyfd5", "a@example.com", second)
+    stored = collection.find_one({ "uid": "limo8tyfd5" })
+    assert stored["version"] == 3
+    assert stored["busy"] == [ { "participant": "a@example.com",
+                                 "spans": [ MONDAY, MONDAY + 2 * HOUR ] },
+                               { "participant": "b@example.com",
+                                 "spans": [ MONDAY, MONDAY + HOUR ] } ]
+
+    assert not submit_busy(collection, "nosuchuid", "a@example.com", first)
+
+
+def test_free_times_memo():
+
+    collection = mongomock.MongoClient().db.schedules
+    collection.insert_one(copy.deepcopy(document))
+    memo = FreeTimes()
+    block, tzinfo = memo.lookup(collection, "limo8tyfd5")
+    assert len(block) == 2
+    assert tzinfo is get_tz("America/Los_Angeles")
+    block, tzinfo = memo.lookup(collection, "limo8tyfd5")
+    assert len(block) == 2
+    assert (memo.hits, memo.misses) == (1, 1)
+
+    # Submitting moves the version on, so the free times are redone
+    busy = Block()
+    busy.add(MONDAY + HOUR, MONDAY + 2 * HOUR)
+    submit_busy(collection, "limo8tyfd5", "a@example.com", busy)
+    assert len(memo.lookup(collection, "limo8tyfd5")[0]) == 3
+    assert memo.misses == 2
+    assert memo.lookup(collection, "nosuchuid") is None
+
+    # Windows are memoized separately, and only hold their own part
+    block, _ = memo.lookup(collection, "limo8tyfd5", MONDAY + DAY, MONDAY + 2 * DAY)
+    assert list(block.spans()) == [ (MONDAY + DAY, MONDAY + DAY + 8 * HOUR) ]
+    assert memo.misses == 3
@@ -0,0 +1,174 @@
+"""
+Server-side sessions.
+
+Flask's default session is a signed cookie holding everything put in
+it, which here means the OAuth credentials and the whole calendar
+list: every request ships that cookie, checks its signature and
+deserializes it.  ServerSideSessionInterface keeps session contents
+in a store instead and only sends a signed session id.  Stores are
+MemoryStore (an LRU in this process; fine for a single process) and
+MongoStore (a collection every worker shares).
+
+ParsedCache keeps objects parsed from session values, such as
+OAuth2Credentials from their JSON, so they aren't parsed again on
+every request.
+"""
+
+import collections
+import datetime
+import threading
+import uuid
+
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(session):
+            session.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class MemoryStore:
+    """ Sessions in this process, least recently used dropped beyond size """
+
+    def __init__(self, size=10000):
+        self._sessions = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._size = size
+
+    def load(self, sid):
+        with self._lock:
+            data = self._sessions.get(sid)
+            if data is None:
+                return None
+            self._sessions.move_to_end(sid)
+            return dict(data)
+
+    def save(self, sid, data):
+        with self._lock:
+            self._sessions[sid] = dict(data)
+            self._sessions.move_to_end(sid)
+            while len(self._sessions) > self._size:
+                self._sessions.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+
+class MongoStore:
+    """
+    Sessions as documents of a collection, which Mongo deletes ttl_days
+    after they were last saved
+    """
+
+    def __init__(self, collection, ttl_days=14):
+        self._collection = collection
+        collection.create_index("updated",
+                                expireAfterSeconds=ttl_days * 24 * 60 * 60)
+
+    def load(self, sid):
+        document = self._collection.find_one({ "_id": sid }, { "data": 1 })
+        return document["data"] if document else None
+
+    def save(self, sid, data):
+        self._collection.replace_one(
+            { "_id": sid },
+            { "data": dict(data), "updated": datetime.datetime.utcnow() },
+            upsert=True)
+
+    def delete(self, sid):
+        self._collection.delete_one({ "_id": sid })
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Sessions kept in store, found by an id in a cookie signed with the
+    app's secret key.  A session is only written back to the store
+    when it has been changed, and the cookie is only set when the
+    session is new.
+    """
+
+    session_class = ServerSideSession
+
+    def __init__(self, store):
+        self.store = store
+
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt="meetme-session")
+
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(app.config["SESSION_COOKIE_NAME"])
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode("ascii")
+            except BadSignature:
+                sid = None
+            data = self.store.load(sid) if sid else None
+            if data is not None:
+                return self.session_class(data, sid)
+        return self.session_class(sid=uuid.uuid4().hex, new=True)
+
+
+    def save_session(self, app, session, response):
+        name = app.config["SESSION_COOKIE_NAME"]
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if session.modified:
+            self.store.save(session.sid, session)
+        if session.new:
+            response.set_cookie(name, self._signer(app).sign(session.sid).decode("ascii"),
+                                expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app),
+                                domain=domain, path=path,
+                                secure=self.get_cookie_secure(app))
+
+
+class ParsedCache:
+    """
+    parse(text) per key, remembered for as long as the text it was
+    parsed from is unchanged.  Least recently used keys are dropped
+    beyond size.
+    """
+
+    def __init__(self, parse, size=10000):
+        self._parse = parse
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._size = size
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, text):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == text:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        parsed = self._parse(text)
+        self.put(key, text, parsed)
+        return parsed
+
+    def put(self, key, text, parsed):
+        """ Remember parsed as what text parses to for key """
+        with self._lock:
+            self._entries[key] = (text, parsed)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
@@ -0,0 +1,84 @@
+import nose, flask
+import mongomock
+from sessions import MemoryStore, MongoStore, ParsedCache, ServerSideSessionInterface
+
+
+#
+#  GLOBAL VARS
+#
+
+
+def make_app(store):
+    app = flask.Flask(__name__)
+    app.secret_key = "testing"
+    app.session_interface = ServerSideSessionInterface(store)
+
+    @app.route("/set/<value>")
+    def set_value(value):
+        flask.session["value"] = value
+        return "ok"
+
+    @app.route("/get")
+    def get_value():
+        return flask.session.get("value", "none")
+
+    @app.route("/clear")
+    def clear():
+        flask.session.clear()
+        return "ok"
+
+    return app
+
+
+#
+#  SESSION TESTING
+#
+
+
+def test_memory_store():
+
+    store = MemoryStore(size=2)
+    store.save("a", { "x": 1 })
+    store.save("b", { "x": 2 })
+    assert store.load("a") == { "x": 1 }
+    store.save("c", { "x": 3 })
+    # b was least recently used
+    assert store.load("b") is None
+    store.delete("a")
+    assert store.load("a") is None
+
+
+def test_server_side_session():
+
+    for store in (MemoryStore(), MongoStore(mongomock.MongoClient().db.sessions)):
+        client = make_app(store).test_client()
+        response = client.get("/set/" + "x" * 5000)
+        cookie = response.headers["Set-Cookie"]
+        # The cookie holds only the signed session id
+        assert len(cookie) < 200
+        assert client.get("/get").get_data(as_text=True) == "x" * 5000
+        # An unchanged session isn't saved again or given a new cookie
+        assert "Set-Cookie" not in client.get("/get").headers
+        client.get("/clear")
+        assert client.get("/get").get_data(as_text=True) == "none"
+
+
+def test_forged_session_id():
+
+    store = MemoryStore()
+    store.save("stolen", { "value": "secret" })
+    client = make_app(store).test_client()
+    # An id that wasn't signed with the app's key is ignored
+    client.set_cookie("localhost", "session", "stolen")
+    assert client.get("/get").get_data(as_text=True) == "none"
+
+
+def test_parsed_cache():
+
+    parsed = []
+    cache = ParsedCache(lambda text: parsed.append(text) or text.upper())
+    assert cache.get("sid", "abc") == "ABC"
+    assert cache.get("sid", "abc") == "ABC"
+    assert cache.get("sid", "abd") == "ABD"
+    assert parsed == [ "abc", "abd" ]
+    assert (cache.hits, cache.misses) == (1, 2)
@@ -0,0 +1,62 @@
+"""
+Searching a schedule for the best times to meet.
+
+Candidate meetings start every granularity seconds from the beginning
+of each window they fit in.  Rather than testing every candidate
+against every participant, each participant's free spans are walked
+once: the candidates a span can hold are a contiguous run of the
+sorted starts (found with two binary searches), so the span adds one
+to that run in a difference array.  A prefix sum then gives, for
+every candidate, how many participants are free for all of it, in
+O(candidates + spans * log candidates) however many there are.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+import heapq
+
+
+def candidate_starts(windows, duration, granularity):
+    """
+    Sorted epoch second starts of every duration-long meeting that
+    fits in one of windows' spans, stepping by granularity from each
+    span's beginning
+    """
+    starts = array('q')
+    for begin, end in windows.spans():
+        starts.extend(range(begin, end - duration + 1, granularity))
+    return starts
+
+
+def free_counts(starts, duration, free_blocks):
+    """
+    For each of starts, how many of free_blocks (one per participant)
+    have a span holding the whole meeting from it
+    """
+    diff = [ 0 ] * (len(starts) + 1)
+    for block in free_blocks:
+        for begin, end in block.spans():
+            first = bisect_left(starts, begin)
+            last = bisect_right(starts, end - duration)
+            if first < last:
+                diff[first] += 1
+                diff[last] -= 1
+    counts = []
+    running = 0
+    for change in diff[:-1]:
+        running += change
+        counts.append(running)
+    return counts
+
+
+def best_slots(windows, free_blocks, duration, granularity, k=5):
+    """
+    Up to k (begin, end, free) meetings of duration seconds within
+    windows, free being how many of free_blocks are free for all of
+    it.  The most free come first, earliest first among equals.
+    """
+    starts = candidate_starts(windows, duration, granularity)
+    counts = free_counts(starts, duration, free_blocks)
+    best = heapq.nsmallest(k, range(len(starts)),
+                           key=lambda i: (-counts[i], starts[i]))
+    return [ (starts[i], starts[i] + duration, counts[i]) for i in best ]
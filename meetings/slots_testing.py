@@ -0,0 +1,61 @@
+import nose, random
+from times import Block
+from slots import candidate_starts, free_counts, best_slots
+
+
+#
+#  GLOBAL VARS
+#
+
+
+HOUR = 60 * 60
+MONDAY = 1511197200 # 2017-11-20T09:00:00-08:00
+
+windows = Block.from_sorted([ MONDAY, MONDAY + 24 * HOUR ],
+                            [ MONDAY + 8 * HOUR, MONDAY + 32 * HOUR ])
+
+
+#
+#  SEARCH TESTING
+#
+
+
+def test_candidate_starts():
+
+    starts = candidate_starts(windows, 7 * HOUR, HOUR // 2)
+    assert list(starts) == [ MONDAY, MONDAY + HOUR // 2, MONDAY + HOUR,
+                             MONDAY + 24 * HOUR, MONDAY + 49 * HOUR // 2,
+                             MONDAY + 25 * HOUR ]
+    assert len(candidate_starts(windows, 9 * HOUR, HOUR)) == 0
+
+
+def test_best_slots():
+
+    # a is free all Monday morning, b only from 10, c only Tuesday
+    a = Block.from_sorted([ MONDAY ], [ MONDAY + 3 * HOUR ])
+    b = Block.from_sorted([ MONDAY + HOUR ], [ MONDAY + 32 * HOUR ])
+    c = Block.from_sorted([ MONDAY + 24 * HOUR ], [ MONDAY + 32 * HOUR ])
+    found = best_slots(windows, [ a, b, c ], HOUR, HOUR, k=3)
+    assert found == [ (MONDAY + HOUR, MONDAY + 2 * HOUR, 2),
+                      (MONDAY + 2 * HOUR, MONDAY + 3 * HOUR, 2),
+                      (MONDAY + 24 * HOUR, MONDAY + 25 * HOUR, 2) ]
+    # With nobody's busy times, the earliest times come first
+    assert best_slots(windows, [ ], HOUR, HOUR, k=1) == [
+        (MONDAY, MONDAY + HOUR, 0) ]
+
+
+def test_free_counts_match_scan():
+
+    rand = random.Random(5)
+    blocks = []
+    for _ in range(12):
+        block = Block()
+        for _ in range(20):
+            begin = MONDAY + 900 * rand.randint(0, 140)
+            block.add(begin, begin + 900 * rand.randint(1, 12))
+        blocks.append(block)
+    starts = candidate_starts(windows, HOUR, 900)
+    expected = [ sum(any(b <= start and start + HOUR <= e
+                         for b, e in block.spans()) for block in blocks)
+                 for start in starts ]
+    assert free_counts(starts, HOUR, blocks) == expected
@@ -1,34 +1,86 @@
+from array import array
+from bisect import bisect_left, bisect_right
+import calendar
+
+import arrow
+
+from windows import UTC, iso_fields
+
+
+def timestamp(value):
+    """
+    UTC epoch seconds for an Arrow, an aware datetime, an ISO 8601
+    string or a number of seconds.  This is the only conversion into
+    the integer form that Chunk and Block work in.
+    """
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        # Straight from the fields, rather than by way of a datetime
+        fields, offset = iso_fields(value)
+        return calendar.timegm(fields[:6]) - (offset or 0)
+    return calendar.timegm(value.utctimetuple())
+
+
+def to_arrow(ts, tzinfo=None):
+    """ Arrow for epoch seconds ts, in tzinfo (default UTC) """
+    return arrow.get(ts).to(tzinfo or UTC)
+
+
+
+
 class Chunk:
+    """
+    A span of time from begin to end, held as UTC epoch seconds.
+    Arrow objects are only made when _begin or _end is asked for.
+    """
+
+    __slots__ = ("begin_ts", "end_ts")
 
 
     def __init__(self, begin, end):
-        self._begin = begin
-        self._end = end
+        self.begin_ts = timestamp(begin)
+        self.end_ts = timestamp(end)
+
+
+    @property
+    def _begin(self):
+        return arrow.get(self.begin_ts)
+
+
+    @property
+    def _end(self):
+        return arrow.get(self.end_ts)
 
 
     def __lt__(self, other):
-        return self._end < other._begin
+        return self.end_ts < other.begin_ts
 
 
     def __gt__ (self, other):
         return other < self
 
 
+    def __eq__(self, other):
+        return (self.begin_ts == other.begin_ts and
+                self.end_ts == other.end_ts)
+
+
     def overlaps(self, other):
         return not (self < other or other < self)
 
 
     def intersect(self, other):
         assert(self.overlaps(other))
-        begin = max(self._begin, other._begin)
-        end = min(self._end, other._end)
+        begin = max(self.begin_ts, other.begin_ts)
+        end = min(self.end_ts, other.end_ts)
         return Chunk(begin, end)
 
 
     def union(self, other):
         assert(self.overlaps(other))
-        begin = min(self._begin, other._begin)
-        end = max(self._end, other._end)
+        begin = min(self.begin_ts, other.begin_ts)
+        end = max(self.end_ts, other.end_ts)
         return Chunk(begin, end)
 
 
@@ -39,85 +91,201 @@ class Chunk:
 
 
 class Block:
+    """
+    A set of times, kept as parallel arrays of begin and end epoch
+    seconds sorted by begin time, in which no two spans overlap
+    (touching spans are joined).  Every operation keeps that
+    invariant, so set operations are single linear sweeps over both
+    operands, and the arrays are themselves the index for point and
+    range queries (stab, overlapping, contains), which are binary
+    searches costing O(log n + k) with nothing extra to keep up to
+    date as spans are added or merged.
+    """
+
+
+    def __init__(self, chunks=()):
+        self._begins = array('q')
+        self._ends = array('q')
+        for chunk in chunks:
+            self.append(chunk)
+
+
+    @classmethod
+    def from_sorted(cls, begins, ends):
+        """
+        Block holding the given begin and end epoch seconds as they
+        are.  They must already be sorted and disjoint.
+        """
+        block = cls()
+        block._begins = array('q', begins)
+        block._ends = array('q', ends)
+        return block
+
+
+    @classmethod
+    def from_spans(cls, spans):
+        """
+        Block of an iterable of (begin, end) epoch second pairs that
+        are already sorted and disjoint, consumed as it goes, so a
+        generator of windows is only expanded as far as it yields.
+        """
+        block = cls()
+        for begin, end in spans:
+            block._push(begin, end)
+        return block
 
 
-    def __init__(self):
-        self._chunks = [ ]
+    def chunks(self):
+        return [ Chunk(b, e) for b, e in zip(self._begins, self._ends) ]
 
 
-    def chunks(self):
-        return self._chunks
+    def spans(self):
+        """ (begin, end) epoch second pairs, in order """
+        return zip(self._begins, self._ends)
 
 
-    def serializable(self):
+    def serializable(self, tzinfo=None):
         result = []
-        for chunk in self._chunks:
-            result.append({"startTime": chunk._begin.format("MM/DD/YYYY HH:mm"), # Format to be human readable
-                           "endTime": chunk._end.format("MM/DD/YYYY HH:mm")}) # Format to be human readable
+        for begin, end in self.spans():
+            result.append({"startTime": to_arrow(begin, tzinfo).format("MM/DD/YYYY HH:mm"), # Format to be human readable
+                           "endTime": to_arrow(end, tzinfo).format("MM/DD/YYYY HH:mm")}) # Format to be human readable
         return result
 
 
     def append(self, chunk):
-        self._chunks.append(chunk)
+        self.add(chunk.begin_ts, chunk.end_ts)
+
+
+    def add(self, begin, end):
+        """
+        Add the span begin..end (epoch seconds), joining it with any
+        spans it overlaps.  Adding in begin order (as calendar events
+        arrive) is constant time; anything else costs a binary search
+        plus the spans absorbed.
+        """
+        begins, ends = self._begins, self._ends
+        if not ends or ends[-1] < begin:
+            begins.append(begin)
+            ends.append(end)
+            return
+        first = bisect_left(ends, begin)
+        last = bisect_right(begins, end, first)
+        if first < last:
+            begin = min(begin, begins[first])
+            end = max(end, ends[last - 1])
+        begins[first:last] = array('q', [begin])
+        ends[first:last] = array('q', [end])
+
+
+    def stab(self, ts):
+        """ (begin, end) of the span holding epoch second ts, or None """
+        k = bisect_right(self._begins, ts) - 1
+        if k >= 0 and ts < self._ends[k]:
+            return self._begins[k], self._ends[k]
+        return None
+
+
+    def overlapping(self, begin, end):
+        """ (begin, end) pairs of the spans that overlap begin..end """
+        first = bisect_right(self._ends, begin)
+        last = bisect_left(self._begins, end, first)
+        return list(zip(self._begins[first:last], self._ends[first:last]))
+
+
+    def contains(self, begin, end):
+        """ Whether all of begin..end lies within one span """
+        k = bisect_right(self._begins, begin) - 1
+        return k >= 0 and end <= self._ends[k]
+
+
+    def _push(self, begin, end):
+        """ Append a span known to lie after every span held """
+        self._begins.append(begin)
+        self._ends.append(end)
 
 
     def intersect(self, other):
         result = Block()
-        for chunk in self._chunks:
-            for o_chunk in other._chunks:
-                if chunk.overlaps(o_chunk):
-                    result.append(chunk.intersect(o_chunk))
+        b1, e1, b2, e2 = self._begins, self._ends, other._begins, other._ends
+        i = j = 0
+        while i < len(b1) and j < len(b2):
+            begin = max(b1[i], b2[j])
+            end = min(e1[i], e2[j])
+            if begin < end:
+                result._push(begin, end)
+            # Whichever span ends first can't meet anything further on
+            if e1[i] < e2[j]:
+                i += 1
+            else:
+                j += 1
 
         return result
 
 
-    def merge(self):
+    def union(self, other):
+        result = Block()
+        begins, ends = result._begins, result._ends
+        b1, e1, b2, e2 = self._begins, self._ends, other._begins, other._ends
+        i = j = 0
+        while i < len(b1) or j < len(b2):
+            if j == len(b2) or (i < len(b1) and b1[i] <= b2[j]):
+                begin, end = b1[i], e1[i]
+                i += 1
+            else:
+                begin, end = b2[j], e2[j]
+                j += 1
+            if ends and not ends[-1] < begin:
+                ends[-1] = max(ends[-1], end)
+            else:
+                begins.append(begin)
+                ends.append(end)
 
-        ordering = lambda c: c._begin
-        self._chunks.sort(key=ordering)
+        return result
 
-        result = [ ]
-        cur = self._chunks[0]
 
-        for chunk in self._chunks[1:]:
-            if chunk  > cur:
-                result.append(cur)
-                cur = chunk
+    def merge(self):
+        """
+        Re-establish the sorted, disjoint invariant for spans that
+        were put in the arrays directly rather than through add.
+        """
+        spans = sorted(self.spans())
+        self._begins = array('q')
+        self._ends = array('q')
+        for begin, end in spans:
+            if self._ends and not self._ends[-1] < begin:
+                self._ends[-1] = max(self._ends[-1], end)
             else:
-                cur = cur.union(chunk)
-
-        result.append(cur)
-        self._chunks = result
+                self._push(begin, end)
 
 
     def merged(self):
         copy = Block()
-        copy._chunks = self._chunks
+        copy._begins = array('q', self._begins)
+        copy._ends = array('q', self._ends)
         copy.merge()
         return copy
 
 
     def complement(self, free):
-        copy = self.merged()
         comp = Block()
-        cur = free._begin
-
-        for chunk in copy._chunks:
-            if chunk < free:
-                continue
-            if chunk > free:
-                if cur < free._end:
-                    comp.append(Chunk(cur, free._end))
-                    cur = free._end
+        begins, ends = self._begins, self._ends
+        cur = free.begin_ts
+
+        for k in range(bisect_left(ends, free.begin_ts), len(begins)):
+            if begins[k] > free.end_ts:
                 break
-            if cur < chunk._begin:
-                comp.append(Chunk(cur, chunk._begin))
-            cur = max(chunk._end, cur)
-        if cur < free._end:
-            comp.append(Chunk(cur, free._end))
+            if cur < begins[k]:
+                comp._push(cur, begins[k])
+            cur = max(ends[k], cur)
+        if cur < free.end_ts:
+            comp._push(cur, free.end_ts)
 
         return comp
 
 
-        def __iter__(self):
-            return self._chunks.__iter__()
+    def __len__(self):
+        return len(self._begins)
+
+
+    def __iter__(self):
+        return iter(self.chunks())
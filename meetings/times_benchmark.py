@@ -0,0 +1,163 @@
+"""
+Micro-benchmarks for the Block interval algebra.
+
+    python3 times_benchmark.py [sizes ...]
+
+Builds two synthetic calendars of n chunks each (free times and the
+complement of a busy calendar, as events() does), times the set
+operations on them and reports how much memory an interval costs.
+The nested-loop intersect that Block used to have is timed too, up
+to --naive-limit chunks, since it is quadratic and takes far too
+long beyond that; at larger sizes its time is extrapolated from the
+largest size measured (n squared) and marked with a *.  Point and range queries are timed against a
+linear scan over the same Block, at the largest size.
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+import arrow
+
+from times import Chunk, Block, timestamp
+
+
+START = timestamp("2017-01-01T00:00:00+00:00")
+
+
+def synthetic_spans(n, seed, start=START):
+    """
+    n disjoint (begin, end) epoch second pairs with random lengths
+    and gaps of up to a few hours, as a calendar of n events has.
+    """
+    rand = random.Random(seed)
+    cur = start
+    for _ in range(n):
+        begin = cur + 60 * rand.randint(1, 240)
+        end = begin + 60 * rand.randint(15, 180)
+        yield begin, end
+        cur = end
+
+
+def synthetic_block(n, seed):
+    block = Block()
+    for begin, end in synthetic_spans(n, seed):
+        block.add(begin, end)
+    return block
+
+
+def bytes_per_interval(n):
+    """
+    Memory per interval held in a Block, and in the list of Arrow
+    pairs Block used to hold, as measured by tracemalloc
+    """
+    spans = list(synthetic_spans(n, seed=3))
+    tracemalloc.start()
+    block = synthetic_block(n, seed=3)
+    as_block = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    tracemalloc.start()
+    pairs = [ (arrow.get(b), arrow.get(e)) for b, e in spans ]
+    as_arrow = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return as_block / n, as_arrow / n
+
+
+def naive_intersect(first, second):
+    """ The original O(n*m) Block.intersect, for comparison """
+    result = Block()
+    others = second.chunks()
+    for chunk in first.chunks():
+        for o_chunk in others:
+            if chunk.overlaps(o_chunk):
+                result.append(chunk.intersect(o_chunk))
+    return result
+
+
+def scan_stab(block, ts):
+    """ Block.stab by looking at every span """
+    for begin, end in block.spans():
+        if begin <= ts < end:
+            return begin, end
+    return None
+
+
+def scan_overlapping(block, begin, end):
+    """ Block.overlapping by looking at every span """
+    return [ (b, e) for b, e in block.spans() if b < end and e > begin ]
+
+
+def time_queries(block, queries, seed=4):
+    """
+    Seconds taken by queries random stabbing and hour-long overlap
+    queries, using the Block's index and by linear scan
+    """
+    rand = random.Random(seed)
+    points = [ rand.randint(block._begins[0], block._ends[-1])
+               for _ in range(queries) ]
+
+    def run(stab, overlapping):
+        start = time.perf_counter()
+        for ts in points:
+            stab(block, ts)
+            overlapping(block, ts, ts + 3600)
+        return time.perf_counter() - start
+
+    return (run(Block.stab, Block.overlapping),
+            run(scan_stab, scan_overlapping))
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Block benchmarks")
+    parser.add_argument("sizes", type=int, nargs="*",
+                        default=[1000, 2000, 10000, 100000])
+    parser.add_argument("--naive-limit", type=int, default=2000,
+                        help="Largest size to run the nested-loop intersect at")
+    parser.add_argument("--queries", type=int, default=200,
+                        help="Stabbing and overlap queries to time")
+    args = parser.parse_args()
+
+    print("{:>8} {:>12} {:>12} {:>12} {:>12}".format(
+        "chunks", "intersect", "union", "complement", "naive"))
+    measured = None
+    for n in sorted(args.sizes):
+        first = synthetic_block(n, seed=1)
+        second = synthetic_block(n, seed=2)
+        span = Chunk(first._begins[0], first._ends[-1])
+        naive = "-"
+        if n <= args.naive_limit:
+            seconds = timed(naive_intersect, first, second)
+            measured = (n, seconds)
+            naive = "{:.4f}s".format(seconds)
+        elif measured:
+            # Quadratic, so it scales with the square of the size
+            naive = "{:.1f}s*".format(measured[1] * (n / measured[0]) ** 2)
+        print("{:>8} {:>11.4f}s {:>11.4f}s {:>11.4f}s {:>12}".format(
+            n,
+            timed(first.intersect, second),
+            timed(first.union, second),
+            timed(second.complement, span),
+            naive))
+
+    if measured and max(args.sizes) > args.naive_limit:
+        print("* extrapolated from the naive intersect at {} chunks".format(measured[0]))
+
+    indexed, scanned = time_queries(synthetic_block(max(args.sizes), seed=1),
+                                    args.queries)
+    print("{} queries over {} chunks: {:.4f}s indexed, {:.4f}s scanning".format(
+        args.queries, max(args.sizes), indexed, scanned))
+
+    block_bytes, arrow_bytes = bytes_per_interval(max(args.sizes))
+    print("bytes per interval: {:.0f} in a Block, {:.0f} as Arrow pairs".format(
+        block_bytes, arrow_bytes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+NumPy engine for free/busy computation.
+
+Instead of complementing and intersecting one calendar's Block at a
+time, this takes the busy intervals of every selected calendar at
+once as start/end arrays of epoch seconds, merges them with a
+vectorized sort and running-max sweep, and takes the complement over
+the schedule range in one pass.  Results are the same as the Block
+path in flask_main.events(); select it with TIMES_ENGINE = numpy.
+"""
+
+import numpy as np
+
+from times import Block
+
+
+def busy_arrays(blocks):
+    """
+    Concatenated begin and end arrays for an iterable of Blocks.
+    Block's arrays are viewed rather than copied.
+    """
+    begins = [ np.frombuffer(block._begins, dtype=np.int64)
+               for block in blocks if len(block) ]
+    ends = [ np.frombuffer(block._ends, dtype=np.int64)
+             for block in blocks if len(block) ]
+    if not begins:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    return np.concatenate(begins), np.concatenate(ends)
+
+
+def merge_busy(begins, ends):
+    """
+    Sorted, disjoint (begins, ends) covering the same times as the
+    given intervals, which may be in any order and overlap.  As in
+    Block, touching intervals are joined.
+    """
+    if len(begins) == 0:
+        return begins, ends
+    order = np.argsort(begins, kind="mergesort")
+    begins = begins[order]
+    ends = np.maximum.accumulate(ends[order])
+    # An interval starts a new run if it begins after every earlier
+    # interval has ended; a run ends where the next one starts, and
+    # the running max there is the end of the whole run
+    starts = np.empty(len(begins), dtype=bool)
+    starts[0] = True
+    starts[1:] = begins[1:] > ends[:-1]
+    last = np.append(starts[1:], True)
+    return begins[starts], ends[last]
+
+
+def complement(begins, ends, lo, hi):
+    """
+    (begins, ends) of the times in lo..hi not covered by the sorted,
+    disjoint intervals given
+    """
+    # Only intervals that overlap or touch lo..hi matter
+    keep = (ends >= lo) & (begins <= hi)
+    begins, ends = begins[keep], ends[keep]
+    gap_begins = np.maximum(np.concatenate(([lo], ends)), lo)
+    gap_ends = np.minimum(np.concatenate((begins, [hi])), hi)
+    gaps = gap_begins < gap_ends
+    return gap_begins[gaps], gap_ends[gaps]
+
+
+def free_block(busy_blocks, free):
+    """
+    Block of the times in Chunk free not covered by any of
+    busy_blocks, equivalent to intersecting each block's complement
+    over free
+    """
+    begins, ends = merge_busy(*busy_arrays(busy_blocks))
+    begins, ends = complement(begins, ends, free.begin_ts, free.end_ts)
+    return Block.from_sorted(begins.tolist(), ends.tolist())
+
+
+def union_block(busy_blocks):
+    """ Block of the times covered by any of busy_blocks """
+    begins, ends = merge_busy(*busy_arrays(busy_blocks))
+    return Block.from_sorted(begins.tolist(), ends.tolist())
@@ -0,0 +1,69 @@
+import nose, random
+import numpy as np
+from times import Chunk, Block
+from times_numpy import merge_busy, complement, free_block
+
+
+#
+#  GLOBAL VARS
+#
+
+
+# Two weeks of 9-5 windows, as created by /_create
+DAY = 24 * 60 * 60
+WEEK_START = 1510851600 # 2017-11-16T09:00:00-08:00
+free_chunk = Chunk(WEEK_START, WEEK_START + 13 * DAY + 8 * 60 * 60)
+windows = Block([ Chunk(WEEK_START + day * DAY,
+                        WEEK_START + day * DAY + 8 * 60 * 60)
+                  for day in range(14) ])
+
+
+def random_calendar(rand, n):
+    """ Block of n possibly overlapping events around the range """
+    block = Block()
+    for _ in range(n):
+        begin = WEEK_START - DAY + 15 * 60 * rand.randint(0, 16 * 4 * 24)
+        block.add(begin, begin + 15 * 60 * rand.randint(0, 16))
+    return block
+
+
+def block_path(calendars):
+    """ Free times as events() computes them with TIMES_ENGINE = block """
+    db_block = windows
+    for block in calendars:
+        if len(block) > 0:
+            db_block = db_block.intersect(block.complement(free_chunk))
+    return db_block
+
+
+#
+#  NUMPY ENGINE TESTING
+#
+
+
+def test_merge_busy():
+
+    begins, ends = merge_busy(np.array([50, 0, 10, 30, 100]),
+                              np.array([60, 10, 20, 40, 120]))
+    # 0-10 and 10-20 touch, so they are joined
+    assert begins.tolist() == [0, 30, 50, 100]
+    assert ends.tolist() == [20, 40, 60, 120]
+
+
+def test_complement():
+
+    begins, ends = complement(np.array([0, 30, 90]), np.array([20, 40, 95]),
+                              10, 90)
+    assert begins.tolist() == [20, 40]
+    assert ends.tolist() == [30, 90]
+
+
+def test_matches_block_path():
+
+    rand = random.Random(322)
+    for trial in range(50):
+        calendars = [ random_calendar(rand, rand.randint(0, 80))
+                      for _ in range(rand.randint(0, 6)) ]
+        expected = block_path(calendars)
+        result = windows.intersect(free_block(calendars, free_chunk))
+        assert list(result.spans()) == list(expected.spans())
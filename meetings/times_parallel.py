@@ -0,0 +1,194 @@
+"""
+Multi-process engine for the free times and best meeting slots of
+large group schedules.
+
+The schedule's range is split into shards (a week each by default,
+each boundary moved to the end of any window it would cut), each
+shard's slice of the windows and of every participant's busy times
+is cut out with binary searches, and the shards are worked out on a
+process pool.  Intervals cross between processes in the packed form
+schedules stores them in ([begin, end, begin, end, ...] epoch
+seconds) as array('q'), which pickles as raw bytes.  No window
+crosses a shard boundary, so neither does any free span or meeting:
+free times are stitched back together by concatenation, and the best
+slots overall are the best of each shard's best.  Results are the
+same as schedules.free_block's and schedules.best_slots' with the
+Block engine; select it with TIMES_ENGINE = parallel
+(PARALLEL_PROCESSES sets the pool size).
+
+Ranges of fewer than MIN_SHARDS shards, such as the week the free
+times feed asks for, aren't worth the trip to the pool and are
+worked out in process.  So is everything under gevent, where the
+pool's helper threads would be greenlets blocking the hub on pipe
+reads.  The pool's processes are forked, so have to be started
+(with pool()) before the app starts any threads of its own, such as
+Mongo's and the job and token pools', or a child can be left holding
+a lock one of them had at the time; flask_main does so as it is
+imported.  A fork server or spawned processes would instead run the
+app's __main__ module over again in each child.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+import heapq
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+
+import slots
+from times import Block, Chunk
+
+
+WEEK = 7 * 24 * 60 * 60
+
+# Pool size when free_block isn't given one (None: one per CPU)
+PROCESSES = None
+
+# Fewest shards worth sending to the pool
+MIN_SHARDS = 4
+
+_pools = { }
+_pools_lock = threading.Lock()
+
+
+def pool(processes=None):
+    """ A process pool of the given size, made once per process """
+    with _pools_lock:
+        if processes not in _pools:
+            method = ("fork" if "fork" in
+                      multiprocessing.get_all_start_methods() else "spawn")
+            _pools[processes] = multiprocessing.get_context(method).Pool(processes)
+        return _pools[processes]
+
+
+def under_gevent():
+    """ Whether gevent has monkey patched threading """
+    monkey = sys.modules.get("gevent.monkey")
+    return bool(monkey and monkey.is_module_patched("threading"))
+
+
+def packed(block):
+    """ array('q') of a Block's spans, flattened """
+    return array('q', itertools.chain.from_iterable(block.spans()))
+
+
+def unpacked(flat):
+    """ Block of a packed array """
+    return Block.from_sorted(flat[0::2], flat[1::2])
+
+
+def clip(flat, lo, hi):
+    """
+    The spans of packed, sorted and disjoint flat that lie within
+    lo..hi, cut at lo and hi.  Since flat is sorted, a bound falls
+    inside a span exactly when an odd number of values come before it.
+    """
+    i = bisect_right(flat, lo)
+    j = bisect_left(flat, hi)
+    result = array('q', flat[i:j])
+    if i % 2:
+        result.insert(0, lo)
+    if j % 2:
+        result.append(hi)
+    return result
+
+
+def shards(lo, hi, width=WEEK, windows=None):
+    """
+    (begin, end) of consecutive shards of about width covering lo..hi.
+    Given windows (a Block), a boundary that would fall inside one of
+    them is moved to its end.
+    """
+    bounds = []
+    begin = lo
+    while begin < hi:
+        end = min(begin + width, hi)
+        window = windows.stab(end) if windows is not None else None
+        if window and window[0] < end:
+            end = min(window[1], hi)
+        bounds.append((begin, end))
+        begin = end
+    return bounds
+
+
+def shard_tasks(windows, busy, lo, hi, width, *rest):
+    """
+    (begin, end, windows, busy, *rest) per shard of lo..hi, with
+    windows (a Block) and busy (packed, one per participant) clipped
+    to the shard
+    """
+    flat_windows = packed(windows)
+    busy = [ array('q', flat) for flat in busy ]
+    return [ (begin, end, clip(flat_windows, begin, end),
+              [ clip(flat, begin, end) for flat in busy ]) + rest
+             for begin, end in shards(lo, hi, width, windows) ]
+
+
+def run(func, tasks, processes=None):
+    """
+    [ func(task) for task in tasks ], on the pool (PROCESSES if
+    processes isn't given) if that is worth it
+    """
+    if processes is None:
+        processes = PROCESSES
+    if processes == 1 or len(tasks) < MIN_SHARDS or under_gevent():
+        return list(map(func, tasks))
+    # A few batches of shards per process, to cut down on round trips
+    batch = max(1, len(tasks) // (4 * (processes or os.cpu_count() or 1)))
+    return pool(processes).map(func, tasks, batch)
+
+
+def shard_free(args):
+    """
+    Packed free times of one shard: (lo, hi, windows, busy) with
+    windows and each of busy packed and already clipped to lo..hi.
+    Runs in a pool process.
+    """
+    lo, hi, windows, flats = args
+    busy = Block()
+    for flat in flats:
+        busy = busy.union(unpacked(flat))
+    return packed(unpacked(windows).intersect(busy.complement(Chunk(lo, hi))))
+
+
+def shard_slots(args):
+    """
+    slots.best_slots of one shard: (lo, hi, windows, busy, duration,
+    granularity, k), windows and busy as for shard_free.  Runs in a
+    pool process.
+    """
+    lo, hi, windows, flats, duration, granularity, k = args
+    free_blocks = [ unpacked(flat).complement(Chunk(lo, hi)) for flat in flats ]
+    return slots.best_slots(unpacked(windows), free_blocks,
+                            duration, granularity, k)
+
+
+def free_block(windows, busy, lo, hi, processes=None, width=WEEK):
+    """
+    Block of the times in windows (a Block) and lo..hi covered by none
+    of busy (packed lists or arrays, one per participant), worked out
+    a shard at a time
+    """
+    parts = run(shard_free, shard_tasks(windows, busy, lo, hi, width), processes)
+    block = Block()
+    for flat in parts:
+        block._begins.extend(flat[0::2])
+        block._ends.extend(flat[1::2])
+    return block
+
+
+def best_slots(windows, busy, lo, hi, duration, granularity, k=5,
+               processes=None, width=WEEK):
+    """
+    Up to k (begin, end, free) meetings, as slots.best_slots gives for
+    windows (a Block) and the free times within lo..hi of each of busy
+    (packed lists or arrays, one per participant), worked out a shard
+    at a time
+    """
+    tasks = shard_tasks(windows, busy, lo, hi, width, duration, granularity, k)
+    found = run(shard_slots, tasks, processes)
+    # Ranked as slots.best_slots ranks them: most free, then earliest
+    return heapq.nsmallest(k, itertools.chain.from_iterable(found),
+                           key=lambda slot: (-slot[2], slot[0]))
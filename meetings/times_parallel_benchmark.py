@@ -0,0 +1,107 @@
+"""
+Scaling of the multi-process free times and best slots engine.
+
+    python3 times_parallel_benchmark.py [--participants N] [--weeks W] [--processes P ...]
+
+Builds a synthetic group schedule of N participants (default 200),
+each with a few events a day over W weeks (default 52) of 9-5
+windows, and times the Block engine's free times and best hour-long
+slots against times_parallel's on pools of each given size (default
+1 up to the number of CPUs), checking that every run gives the Block
+engine's answer.  A pool is started and warmed before it is timed,
+as a long-running server's would be.
+"""
+
+import argparse
+import os
+import random
+import time
+
+from times import Chunk, Block
+import schedules
+import slots
+import times_parallel
+
+
+DAY = 24 * 60 * 60
+START = 1510851600 # 2017-11-16T09:00:00-08:00
+
+
+def group(participants, weeks, per_day, seed=25):
+    """ (windows Block, packed busy lists, lo, hi) of a synthetic schedule """
+    rand = random.Random(seed)
+    days = 7 * weeks
+    windows = Block.from_spans((START + day * DAY, START + day * DAY + 8 * 60 * 60)
+                               for day in range(days))
+    busy = []
+    for _ in range(participants):
+        block = Block()
+        for _ in range(per_day * days):
+            begin = START - 2 * 60 * 60 + 15 * 60 * rand.randint(0, days * 4 * 24)
+            block.add(begin, begin + 15 * 60 * rand.randint(1, 8))
+        busy.append(schedules.pack(block))
+    return windows, busy, START, START + (days - 1) * DAY + 8 * 60 * 60
+
+
+def serial_free(windows, busy, lo, hi):
+    union = schedules.union_blocks([ schedules.unpack(flat) for flat in busy ])
+    return list(windows.intersect(union.complement(Chunk(lo, hi))).spans())
+
+
+def parallel_free(windows, busy, lo, hi, processes):
+    return list(times_parallel.free_block(windows, busy, lo, hi, processes).spans())
+
+
+def serial_slots(windows, busy, lo, hi):
+    free_blocks = [ schedules.unpack(flat).complement(Chunk(lo, hi)) for flat in busy ]
+    return slots.best_slots(windows, free_blocks, 3600, 900, 10)
+
+
+def parallel_slots(windows, busy, lo, hi, processes):
+    return times_parallel.best_slots(windows, busy, lo, hi, 3600, 900, 10, processes)
+
+
+def timed(func, *args, repeat=3):
+    """ (best seconds of repeat runs, result) """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Parallel free times benchmark")
+    parser.add_argument("--participants", type=int, default=200)
+    parser.add_argument("--weeks", type=int, default=52)
+    parser.add_argument("--per-day", type=int, default=6,
+                        help="Events per participant per day")
+    parser.add_argument("--processes", type=int, nargs="*",
+                        default=list(range(1, cpus + 1)))
+    args = parser.parse_args()
+
+    windows, busy, lo, hi = group(args.participants, args.weeks, args.per_day)
+    intervals = sum(len(flat) // 2 for flat in busy)
+    print("{} participants, {} weeks, {} busy intervals, {} CPUs".format(
+        args.participants, args.weeks, intervals, cpus))
+
+    print("{:>8} {:>10} {:>10} {:>8}".format("work", "engine", "seconds", "speedup"))
+    for work, serial, parallel in (("free", serial_free, parallel_free),
+                                   ("slots", serial_slots, parallel_slots)):
+        base, expected = timed(serial, windows, busy, lo, hi)
+        print("{:>8} {:>10} {:>9.3f}s {:>7.2f}x".format(work, "block", base, 1.0))
+        for processes in args.processes:
+            if processes > 1:
+                # Start the pool's processes before timing it
+                times_parallel.pool(processes).map(abs, range(processes))
+            seconds, result = timed(parallel, windows, busy, lo, hi, processes)
+            assert result == expected, (work, processes)
+            print("{:>8} {:>10} {:>9.3f}s {:>7.2f}x".format(
+                work, "{} proc".format(processes), seconds, base / seconds))
+
+
+if __name__ == "__main__":
+    main()
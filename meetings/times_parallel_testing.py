@@ -0,0 +1,101 @@
+import nose, random
+from array import array
+from times import Chunk, Block
+from times_parallel import clip, shards, free_block, best_slots
+import schedules
+import slots
+
+
+#
+#  GLOBAL VARS
+#
+
+
+DAY = 24 * 60 * 60
+START = 1510851600 # 2017-11-16T09:00:00-08:00
+
+
+def daily_windows(days, hours):
+    """ Block of days windows of hours each, from START """
+    return Block.from_spans((START + day * DAY, START + day * DAY + hours * 60 * 60)
+                            for day in range(days))
+
+
+def random_busy(rand, days, n):
+    """ Packed busy times of n possibly overlapping events over days """
+    block = Block()
+    for _ in range(n):
+        begin = START - DAY + 15 * 60 * rand.randint(0, (days + 2) * 4 * 24)
+        block.add(begin, begin + 15 * 60 * rand.randint(1, 64))
+    return schedules.pack(block)
+
+
+def block_path(windows, busy, lo, hi):
+    """ Free times as schedules.free_block works them out with Block """
+    span = Chunk(lo, hi)
+    union = schedules.union_blocks([ schedules.unpack(flat) for flat in busy ])
+    return windows.intersect(union.complement(span))
+
+
+#
+#  PARALLEL ENGINE TESTING
+#
+
+
+def test_clip():
+
+    flat = array('q', [0, 10, 20, 30, 40, 50])
+    assert list(clip(flat, 0, 50)) == [0, 10, 20, 30, 40, 50]
+    # Spans that cross a bound are cut at it
+    assert list(clip(flat, 5, 45)) == [5, 10, 20, 30, 40, 45]
+    # Spans that only touch a bound are left out
+    assert list(clip(flat, 10, 20)) == [ ]
+    assert list(clip(flat, 25, 28)) == [25, 28]
+
+
+def test_shards():
+
+    assert shards(0, 25, 10) == [ (0, 10), (10, 20), (20, 25) ]
+    assert shards(0, 0, 10) == [ ]
+    # Boundaries inside a window move to its end, not at its start
+    windows = Block.from_spans([ (8, 12), (20, 23), (23, 27) ])
+    assert shards(0, 40, 10, windows) == [ (0, 12), (12, 23), (23, 33), (33, 40) ]
+
+
+def test_same_as_block():
+
+    rand = random.Random(25)
+    lo, hi = START, START + 27 * DAY + 8 * 60 * 60
+    for hours in (8, 24):
+        # 24 hour windows touch, so shards end where windows do
+        windows = daily_windows(28, hours)
+        busy = [ random_busy(rand, 28, 40) for _ in range(12) ]
+        expected = list(block_path(windows, busy, lo, hi).spans())
+        for width in (DAY // 3, 5 * DAY, 7 * DAY, 40 * DAY):
+            for processes in (1, 2):
+                result = free_block(windows, busy, lo, hi, processes, width)
+                assert list(result.spans()) == expected
+
+
+def test_no_busy_times():
+
+    windows = daily_windows(14, 24)
+    lo, hi = START, START + 14 * DAY
+    assert (list(free_block(windows, [ ], lo, hi, 1, DAY).spans())
+            == list(windows.spans()))
+
+
+def test_best_slots_same_as_block():
+
+    rand = random.Random(15)
+    lo, hi = START, START + 27 * DAY + 8 * 60 * 60
+    for hours in (8, 24):
+        windows = daily_windows(28, hours)
+        busy = [ random_busy(rand, 28, 40) for _ in range(12) ]
+        span = Chunk(lo, hi)
+        free_blocks = [ schedules.unpack(flat).complement(span) for flat in busy ]
+        expected = slots.best_slots(windows, free_blocks, 60 * 60, 15 * 60, 10)
+        for width in (DAY // 3, 5 * DAY, 40 * DAY):
+            for processes in (1, 2):
+                assert best_slots(windows, busy, lo, hi, 60 * 60, 15 * 60, 10,
+                                  processes, width) == expected
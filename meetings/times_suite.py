@@ -0,0 +1,152 @@
+"""
+Regression benchmarks for the interval algebra.
+
+    python3 times_suite.py [--sizes n ...] [--save FILE | --check FILE]
+
+Times Block's merge, complement, intersect, union and serializable
+and the schedules block_to_db / db_to_block conversions on synthetic
+calendars of each size (10 to 1M chunks), taking the best of
+--repeat runs.  --save writes the results as a baseline; --check
+compares against one and exits non-zero if any case has become more
+than --threshold times slower.  times_baseline.json holds the
+baseline for the default sizes; baselines are only comparable on the
+machine that made them, so refresh it (--save) when that changes.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from times import Chunk, Block
+import schedules
+from times_benchmark import synthetic_block, synthetic_spans
+
+
+def unmerged_block(n):
+    """ Block whose arrays hold overlapping spans out of order """
+    spans = list(synthetic_spans(n, seed=5))
+    # Every span also overlaps the one after it
+    spans += [ (b + 60, e + 600) for b, e in spans ]
+    spans.reverse()
+    return Block.from_sorted([ b for b, e in spans ], [ e for b, e in spans ])
+
+
+def case_merge(n):
+    block = unmerged_block(n)
+    return block.merged
+
+
+def case_complement(n):
+    block = synthetic_block(n, seed=1)
+    span = Chunk(block._begins[0], block._ends[-1])
+    return lambda: block.complement(span)
+
+
+def case_intersect(n):
+    first, second = synthetic_block(n, seed=1), synthetic_block(n, seed=2)
+    return lambda: first.intersect(second)
+
+
+def case_union(n):
+    first, second = synthetic_block(n, seed=1), synthetic_block(n, seed=2)
+    return lambda: first.union(second)
+
+
+def case_serializable(n):
+    block = synthetic_block(n, seed=1)
+    return block.serializable
+
+
+def case_block_to_db(n):
+    block = synthetic_block(n, seed=1)
+    return lambda: schedules.block_to_db(block)
+
+
+def case_db_to_block(n):
+    stored = schedules.block_to_db(synthetic_block(n, seed=1))
+    return lambda: schedules.db_to_block(stored)
+
+
+# name: (make a function to time for n chunks, largest n worth timing)
+CASES = {
+    "merge": (case_merge, None),
+    "complement": (case_complement, None),
+    "intersect": (case_intersect, None),
+    "union": (case_union, None),
+    # These make an Arrow or ISO string per span and are far slower
+    "serializable": (case_serializable, 100000),
+    "block_to_db": (case_block_to_db, 100000),
+    "db_to_block": (case_db_to_block, 100000),
+}
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(sizes, repeat):
+    """ {"case/n": best seconds} for every case at every size it runs at """
+    results = { }
+    for name, (make, limit) in CASES.items():
+        for n in sizes:
+            if limit and n > limit:
+                continue
+            results["{}/{}".format(name, n)] = best_time(make(n), repeat)
+    return results
+
+
+def regressions(results, baseline, threshold):
+    """ (key, seconds, baseline seconds) of cases slower than allowed """
+    slower = []
+    for key, seconds in sorted(results.items()):
+        base = baseline.get(key)
+        # Cases too quick to time reliably are left out
+        if base and base > 1e-4 and seconds > base * threshold:
+            slower.append((key, seconds, base))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Interval algebra regression benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="*",
+                        default=[10, 1000, 100000],
+                        help="Chunks per calendar; add 1000000 for the full run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", metavar="FILE", help="Write results as a baseline")
+    parser.add_argument("--check", metavar="FILE", help="Compare with a baseline")
+    parser.add_argument("--threshold", type=float, default=1.5,
+                        help="Slowdown over the baseline counted as a regression")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat)
+    baseline = { }
+    if args.check:
+        with open(args.check) as f:
+            baseline = json.load(f)
+
+    print("{:<24} {:>12} {:>12}".format("case", "seconds", "baseline"))
+    for key, seconds in sorted(results.items()):
+        base = baseline.get(key)
+        print("{:<24} {:>12.6f} {:>12}".format(
+            key, seconds, "{:.6f}".format(base) if base else "-"))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.check:
+        slower = regressions(results, baseline, args.threshold)
+        for key, seconds, base in slower:
+            print("REGRESSION {}: {:.6f}s against {:.6f}s".format(key, seconds, base))
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
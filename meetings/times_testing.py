@@ -1,5 +1,5 @@
-import nose, arrow
-from times import Chunk, Block
+import nose, arrow, random
+from times import Chunk, Block, timestamp
 
 
 #
@@ -40,20 +40,180 @@ def test_chunk_initialization():
 
 def test_block_initialization():
 
-    cks = [ chunk_4 = Chunk(arrow.get("2017-11-16T02:00:00-08:00"),
-                            arrow.get("2017-11-16T06:00:00-08:00"))
-                      Chunk(arrow.get("2017-11-16T04:00:00-08:00"),
-                            arrow.get("2017-11-16T08:00:00-08:00"))
-                      Chunk(arrow.get("2017-11-16T10:00:00-08:00"),
-                            arrow.get("2017-11-16T18:00:00-08:00"))
-                      Chunk(arrow.get("2017-11-16T12:00:00-08:00"),
-                            arrow.get("2017-11-16T20:00:00-08:00")) ]
+    cks = [ Chunk(arrow.get("2017-11-16T02:00:00-08:00"),
+                  arrow.get("2017-11-16T06:00:00-08:00")),
+            Chunk(arrow.get("2017-11-16T04:00:00-08:00"),
+                  arrow.get("2017-11-16T08:00:00-08:00")),
+            Chunk(arrow.get("2017-11-16T10:00:00-08:00"),
+                  arrow.get("2017-11-16T18:00:00-08:00")),
+            Chunk(arrow.get("2017-11-16T12:00:00-08:00"),
+                  arrow.get("2017-11-16T20:00:00-08:00")) ]
 
 
-    # Test to see if blocks combine chunks at init
+    # Test to see if blocks combine chunks at init; 08:00-10:00 is
+    # covered by none of them, so two spans are left
     block = Block()
     [ block.append(chunk) for chunk in cks ]
     assert block.chunks() == [ Chunk(arrow.get("2017-11-16T02:00:00-08:00"),
+                                     arrow.get("2017-11-16T08:00:00-08:00")),
+                               Chunk(arrow.get("2017-11-16T10:00:00-08:00"),
                                      arrow.get("2017-11-16T20:00:00-08:00")) ]
 
     print("Block initialiation working!")
+
+
+def test_block_append_out_of_order():
+
+    block = Block()
+    block.append(Chunk(arrow.get("2017-11-16T12:00:00-08:00"),
+                       arrow.get("2017-11-16T13:00:00-08:00")))
+    block.append(Chunk(arrow.get("2017-11-16T09:00:00-08:00"),
+                       arrow.get("2017-11-16T10:00:00-08:00")))
+    block.append(Chunk(arrow.get("2017-11-16T15:00:00-08:00"),
+                       arrow.get("2017-11-16T16:00:00-08:00")))
+    # Bridges the first two chunks
+    block.append(Chunk(arrow.get("2017-11-16T09:30:00-08:00"),
+                       arrow.get("2017-11-16T12:30:00-08:00")))
+
+    assert block.chunks() == [ Chunk(arrow.get("2017-11-16T09:00:00-08:00"),
+                                     arrow.get("2017-11-16T13:00:00-08:00")),
+                               Chunk(arrow.get("2017-11-16T15:00:00-08:00"),
+                                     arrow.get("2017-11-16T16:00:00-08:00")) ]
+
+
+def test_block_intersect():
+
+    free = Block([ chunk_1 ])
+    busy_free = Block([ Chunk(arrow.get("2017-11-16T08:00:00-08:00"),
+                              arrow.get("2017-11-16T10:00:00-08:00")),
+                        Chunk(arrow.get("2017-11-16T11:00:00-08:00"),
+                              arrow.get("2017-11-16T12:00:00-08:00")),
+                        Chunk(arrow.get("2017-11-16T17:00:00-08:00"),
+                              arrow.get("2017-11-16T18:00:00-08:00")) ])
+
+    # Touching at 17:00 is not a shared free time
+    assert free.intersect(busy_free).chunks() == [
+        Chunk(arrow.get("2017-11-16T09:00:00-08:00"),
+              arrow.get("2017-11-16T10:00:00-08:00")),
+        Chunk(arrow.get("2017-11-16T11:00:00-08:00"),
+              arrow.get("2017-11-16T12:00:00-08:00")) ]
+    assert free.intersect(Block()).chunks() == [ ]
+
+
+def test_block_union():
+
+    first = Block([ chunk_1 ])
+    second = Block([ chunk_2 ])
+    assert first.union(second).chunks() == [
+        Chunk(arrow.get("2017-11-16T09:00:00-08:00"),
+              arrow.get("2017-11-16T20:00:00-08:00")) ]
+    assert first.union(Block()).chunks() == [ chunk_1 ]
+
+
+def test_block_complement():
+
+    busy = Block([ Chunk(arrow.get("2017-11-16T01:00:00-08:00"),
+                         arrow.get("2017-11-16T03:00:00-08:00")),
+                   Chunk(arrow.get("2017-11-16T10:00:00-08:00"),
+                         arrow.get("2017-11-16T11:00:00-08:00")),
+                   Chunk(arrow.get("2017-11-16T19:00:00-08:00"),
+                         arrow.get("2017-11-16T21:00:00-08:00")) ])
+
+    assert busy.complement(chunk_3).chunks() == [
+        Chunk(arrow.get("2017-11-16T03:00:00-08:00"),
+              arrow.get("2017-11-16T10:00:00-08:00")),
+        Chunk(arrow.get("2017-11-16T11:00:00-08:00"),
+              arrow.get("2017-11-16T19:00:00-08:00")) ]
+    assert Block().complement(chunk_3).chunks() == [ chunk_3 ]
+
+
+def test_timestamp():
+
+    assert timestamp("2017-11-16T09:00:00-08:00") == 1510851600
+    assert timestamp("2017-11-16T17:00:00Z") == 1510851600
+    assert timestamp(arrow.get("2017-11-16T17:00:00+00:00")) == 1510851600
+    assert timestamp(1510851600) == 1510851600
+    # Fractional seconds, offsets without a colon and plain dates
+    assert timestamp("2017-11-16T17:00:00.250Z") == 1510851600
+    assert timestamp("2017-11-16T22:30:00+0530") == 1510851600
+    assert timestamp("2017-11-16") == 1510790400
+    try:
+        timestamp("11/16/2017")
+        assert False, "Expected ValueError"
+    except ValueError:
+        pass
+
+
+def test_block_add():
+
+    block = Block()
+    block.add(100, 200)
+    block.add(300, 400)
+    block.add(200, 300)
+    assert list(block.spans()) == [ (100, 400) ]
+    block.add(0, 50)
+    assert list(block.spans()) == [ (0, 50), (100, 400) ]
+
+
+def test_block_queries():
+
+    block = Block.from_sorted([ 100, 300, 500 ], [ 200, 400, 600 ])
+    assert block.stab(100) == (100, 200)
+    assert block.stab(250) is None
+    assert block.stab(200) is None
+    assert block.stab(50) is None
+    assert block.overlapping(150, 350) == [ (100, 200), (300, 400) ]
+    assert block.overlapping(200, 300) == [ ]
+    assert block.overlapping(0, 1000) == list(block.spans())
+    assert block.contains(300, 400)
+    assert not block.contains(150, 350)
+    assert not block.contains(50, 60)
+
+
+#
+#  PROPERTY TESTING
+#
+#  Random Blocks checked against sets of the whole seconds they
+#  cover, over many seeded cases so failures can be replayed.
+#
+
+
+def random_block(rand, spans=8, horizon=200):
+    block = Block()
+    for _ in range(rand.randint(0, spans)):
+        begin = rand.randint(0, horizon)
+        block.add(begin, begin + rand.randint(1, 30))
+    return block
+
+
+def points(block):
+    return { ts for begin, end in block.spans() for ts in range(begin, end) }
+
+
+def well_formed(block):
+    spans = list(block.spans())
+    return (all(begin < end for begin, end in spans) and
+            all(e1 < b2 for (b1, e1), (b2, e2) in zip(spans, spans[1:])))
+
+
+def test_block_properties():
+
+    rand = random.Random(17)
+    for case in range(500):
+        first, second = random_block(rand), random_block(rand)
+        lo = rand.randint(0, 100)
+        free = Chunk(lo, lo + rand.randint(1, 150))
+        union = first.union(second)
+        intersection = first.intersect(second)
+        complement = first.complement(free)
+        for block in (union, intersection, complement):
+            assert well_formed(block), case
+        assert points(union) == points(first) | points(second), case
+        assert points(intersection) == points(first) & points(second), case
+        assert points(complement) == set(range(free.begin_ts, free.end_ts)) - points(first), case
+        assert list(union.spans()) == list(second.union(first).spans()), case
+
+        unmerged = Block.from_sorted(
+            list(first._begins) + list(second._begins),
+            list(first._ends) + list(second._ends))
+        assert list(unmerged.merged().spans()) == list(union.spans()), case
@@ -0,0 +1,105 @@
+"""
+Refreshing OAuth access tokens before they run out.
+
+Google access tokens last an hour.  Rather than sending the user
+back through the whole authorization redirect once one has expired,
+TokenRefresher uses the stored refresh token: credentials within
+margin seconds of expiry are refreshed in the background while the
+request carries on with the current token, and expired ones are
+refreshed before the request goes on.  Refreshes are de-duplicated per
+key (a session), so however many requests arrive together only one
+goes to Google's token endpoint and the rest share its result.
+"""
+
+import collections
+import concurrent.futures
+import datetime
+import logging
+import threading
+
+import httplib2
+
+log = logging.getLogger(__name__)
+
+
+class TokenRefresher:
+
+    def __init__(self, margin=300, workers=4, timeout=10, size=10000,
+                 clock=datetime.datetime.utcnow):
+        self._margin = datetime.timedelta(seconds=margin)
+        self._timeout = timeout
+        self._clock = clock
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+        self._pending = { }
+        # Keys refreshed but not yet asked about, oldest dropped beyond
+        # size: a session that never comes back (or comes back to
+        # another process) is never asked about
+        self._refreshed = collections.OrderedDict()
+        self._size = size
+        self.refreshes = 0
+        self.failures = 0
+
+
+    def fresh(self, key, credentials):
+        """
+        credentials, refreshed first if they have expired, or None if
+        they are invalid or expired and can't be refreshed
+        """
+        if credentials.invalid:
+            return None
+        expiry = credentials.token_expiry
+        if expiry is None or expiry - self._clock() > self._margin:
+            return credentials
+        expired = expiry <= self._clock()
+        if credentials.refresh_token is None:
+            return None if expired else credentials
+
+        future = self._refresh(key, credentials)
+        if not expired:
+            # Still good for now; the refresh carries on behind us
+            return credentials
+        try:
+            return future.result(self._timeout)
+        except Exception as err:
+            log.info("Couldn't refresh access token: {}".format(err))
+            return None
+
+
+    def refreshed(self, key):
+        """
+        Whether key's credentials have been refreshed since this was
+        last asked, and so need saving again
+        """
+        with self._lock:
+            return self._refreshed.pop(key, False)
+
+
+    def _refresh(self, key, credentials):
+        """ The refresh under way for key, started if there isn't one """
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pool.submit(self._run, key, credentials)
+                self._pending[key] = future
+            return future
+
+
+    def _run(self, key, credentials):
+        try:
+            credentials.refresh(httplib2.Http(timeout=self._timeout))
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            raise
+        else:
+            with self._lock:
+                self.refreshes += 1
+                self._refreshed[key] = True
+                self._refreshed.move_to_end(key)
+                while len(self._refreshed) > self._size:
+                    self._refreshed.popitem(last=False)
+            return credentials
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
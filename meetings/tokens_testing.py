@@ -0,0 +1,98 @@
+import nose, datetime, threading, time
+from tokens import TokenRefresher
+
+
+#
+#  GLOBAL VARS
+#
+
+
+NOW = datetime.datetime(2017, 11, 20, 17, 0)
+
+
+class FakeCredentials:
+    """ The parts of OAuth2Credentials TokenRefresher uses """
+
+    def __init__(self, expires_in, refresh_token="refresh", fail=False):
+        self.invalid = False
+        self.token_expiry = NOW + datetime.timedelta(seconds=expires_in)
+        self.refresh_token = refresh_token
+        self.fail = fail
+        self.refreshes = 0
+
+    def refresh(self, http):
+        time.sleep(0.05)
+        if self.fail:
+            raise RuntimeError("invalid_grant")
+        self.refreshes += 1
+        self.token_expiry = NOW + datetime.timedelta(hours=1)
+
+
+def refresher():
+    return TokenRefresher(margin=300, clock=lambda: NOW)
+
+
+#
+#  REFRESH TESTING
+#
+
+
+def test_fresh_credentials_untouched():
+
+    tokens = refresher()
+    credentials = FakeCredentials(3600)
+    assert tokens.fresh("sid", credentials) is credentials
+    assert credentials.refreshes == 0
+    assert not tokens.refreshed("sid")
+
+
+def test_expired_refreshed_once():
+
+    tokens = refresher()
+    credentials = FakeCredentials(-60)
+    results = []
+    threads = [ threading.Thread(target=lambda: results.append(
+                    tokens.fresh("sid", credentials)))
+                for _ in range(10) ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Every request waited on the one refresh
+    assert results == [ credentials ] * 10
+    assert credentials.refreshes == 1
+    assert tokens.refreshed("sid")
+    assert not tokens.refreshed("sid")
+
+
+def test_expiring_refreshed_in_background():
+
+    tokens = refresher()
+    credentials = FakeCredentials(120)
+    assert tokens.fresh("sid", credentials) is credentials
+    assert credentials.refreshes == 0
+    time.sleep(0.2)
+    assert credentials.refreshes == 1
+    assert tokens.refreshed("sid")
+
+
+def test_cannot_refresh():
+
+    tokens = refresher()
+    assert tokens.fresh("sid", FakeCredentials(-60, refresh_token=None)) is None
+    assert tokens.fresh("sid", FakeCredentials(-60, fail=True)) is None
+    assert tokens.failures == 1
+    # Not yet expired, so usable until it is
+    expiring = FakeCredentials(60, refresh_token=None)
+    assert tokens.fresh("sid", expiring) is expiring
+
+
+def test_refreshed_bounded():
+
+    tokens = TokenRefresher(margin=300, size=2, clock=lambda: NOW)
+    for key in ("a", "b", "c"):
+        tokens.fresh(key, FakeCredentials(-60))
+    # a's session never asked, and was dropped to make room
+    assert not tokens.refreshed("a")
+    assert tokens.refreshed("b")
+    assert tokens.refreshed("c")
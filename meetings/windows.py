@@ -0,0 +1,255 @@
+"""
+Parsing the date range and times a schedule is created with, and
+generating its daily windows from a DailyRule.
+
+The range and times are parsed once into plain dates and (hour,
+minute) pairs, each day's window is made by date arithmetic in the
+schedule's time zone (so days either side of a DST change each get
+the right offset), and only the caller serializes the results.
+Schedules store the rule rather than the windows, and windows are
+only made for the days a reader asks about.  Time zone objects are
+looked up once per process and cached.
+"""
+
+import calendar
+import datetime
+import functools
+import re
+
+from dateutil import tz
+
+
+UTC = tz.tzutc()
+
+
+# What IANA zone names look like: slash-separated words, such as
+# America/Argentina/Buenos_Aires or Etc/GMT+3, never a path or a
+# POSIX TZ string like EST5EDT,M3.2.0,M11.1.0
+ZONE_NAME = re.compile(r"[A-Za-z][A-Za-z0-9_+-]*(?:/[A-Za-z0-9_+-]+)*\Z")
+
+
+def get_tz(name):
+    """
+    tzinfo for an IANA zone name such as America/Los_Angeles.  Raises
+    ValueError for a name that isn't one; gettz alone would also take
+    POSIX TZ strings and file paths, and schedules' zones come from
+    clients.
+    """
+    zone = None
+    if isinstance(name, str) and ZONE_NAME.match(name):
+        zone = load_tz(name)
+    if zone is None:
+        raise ValueError("Unknown time zone '{}'".format(name))
+    return zone
+
+
+@functools.lru_cache(maxsize=1024)
+def load_tz(name):
+    """
+    tzinfo for a zone name shaped like an IANA one, from the system's
+    zone files (which know zones newer than the copy dateutil ships
+    with) or else dateutil's, or None if neither has it.  Cached, since
+    looking zones up means reading zone files; each zone's DST rules
+    are then worked out once.
+    """
+    if name == "UTC":
+        return UTC
+    zone = tz.gettz(name)
+    # Anything else gettz makes of a name isn't a zone from a zone file
+    if not isinstance(zone, tz.tzfile):
+        return None
+    return zone
+
+
+def parse_date(text):
+    """ datetime.date for text in MM/DD/YYYY form """
+    month, day, year = text.strip().split("/")
+    return datetime.date(int(year), int(month), int(day))
+
+
+def parse_clock(text):
+    """
+    (hour, minute) for a time of day written 1pm, 1:30pm, 1:30 pm
+    or 13:30.  Raises ValueError for anything else.
+    """
+    text = text.strip().lower()
+    suffix = text[-2:]
+    if suffix in ("am", "pm"):
+        text = text[:-2].strip()
+    elif ":" not in text:
+        raise ValueError("Time '{}' has neither am/pm nor minutes".format(text))
+    hour, _, minute = text.partition(":")
+    hour = int(hour)
+    minute = int(minute) if minute else 0
+    if suffix in ("am", "pm"):
+        if not 1 <= hour <= 12:
+            raise ValueError("Hour {} out of range".format(hour))
+        hour = hour % 12 + (12 if suffix == "pm" else 0)
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        raise ValueError("Time {}:{} out of range".format(hour, minute))
+    return hour, minute
+
+
+# An ISO 8601 date, or date and time with optional fractional seconds
+# and offset, as Google (RFC 3339) and FullCalendar write them
+ISO_8601 = re.compile(r"(\d{4})-(\d\d)-(\d\d)"
+                      r"(?:[T ](\d\d):(\d\d)(?::(\d\d)(?:\.(\d+))?)?"
+                      r"(Z|[+-]\d\d:?\d\d)?)?$")
+
+
+@functools.lru_cache(maxsize=64)
+def offset_seconds(text):
+    """ Seconds east of UTC for an offset written Z, +HH:MM or +HHMM """
+    if text == "Z":
+        return 0
+    seconds = int(text[1:3]) * 3600 + int(text[-2:]) * 60
+    return -seconds if text[0] == "-" else seconds
+
+
+def iso_fields(text):
+    """
+    ((year, month, day, hour, minute, second, microsecond), offset)
+    of ISO 8601 text matching ISO_8601, offset being seconds east of
+    UTC or None if it has none.  (datetime.fromisoformat only arrived
+    in Python 3.7, and only reads Z from 3.11.)  Raises ValueError for
+    anything else.
+    """
+    match = ISO_8601.match(text.strip())
+    if match is None:
+        raise ValueError("Not an ISO 8601 date or time: '{}'".format(text))
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    fields = (int(year), int(month), int(day), int(hour or 0), int(minute or 0),
+              int(second or 0), int((fraction or "0")[:6].ljust(6, "0")))
+    return fields, offset_seconds(offset) if offset else None
+
+
+def parse_iso(text):
+    """ datetime for ISO 8601 text (see iso_fields), aware if it has an offset """
+    fields, offset = iso_fields(text)
+    if offset is None:
+        return datetime.datetime(*fields)
+    tzinfo = UTC if offset == 0 else datetime.timezone(datetime.timedelta(seconds=offset))
+    return datetime.datetime(*fields, tzinfo=tzinfo)
+
+
+def parse_bound(text, tzinfo):
+    """
+    Epoch seconds for a window bound as FullCalendar sends it: an ISO
+    8601 date or date and time, taken to be in tzinfo unless it has
+    an offset of its own
+    """
+    moment = parse_iso(text)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=tzinfo)
+    return epoch(moment)
+
+
+def at(date, clock, tzinfo):
+    """ Aware datetime for (hour, minute) clock on date in tzinfo """
+    return datetime.datetime(date.year, date.month, date.day,
+                             clock[0], clock[1], tzinfo=tzinfo)
+
+
+def epoch(moment):
+    """ UTC epoch seconds of an aware datetime """
+    return calendar.timegm(moment.utctimetuple())
+
+
+def isoformat(ts, tzinfo=UTC):
+    """ ISO 8601 text for epoch seconds ts in tzinfo """
+    return datetime.datetime.fromtimestamp(ts, tzinfo).isoformat()
+
+
+def daily_windows(begin_date, end_date, begin_clock, end_clock, tzinfo):
+    """
+    Generate (begin, end) aware datetimes for the window from
+    begin_clock to end_clock on each day from begin_date to end_date
+    inclusive
+    """
+    one_day = datetime.timedelta(days=1)
+    date = begin_date
+    while date <= end_date:
+        yield at(date, begin_clock, tzinfo), at(date, end_clock, tzinfo)
+        date += one_day
+
+
+class DailyRule:
+    """
+    A schedule's availability as a recurrence rule rather than a list
+    of days: the window from begin_clock to end_clock on each day
+    from begin_date to end_date, skipping Saturdays and Sundays if
+    weekdays_only and any dates in exclude.  Windows are only worked
+    out for the days asked for, so a rule costs the same to store and
+    load however long its range is.
+    """
+
+    def __init__(self, begin_date, end_date, begin_clock, end_clock, tzinfo,
+                 weekdays_only=False, exclude=()):
+        self.begin_date = begin_date
+        self.end_date = end_date
+        self.begin_clock = begin_clock
+        self.end_clock = end_clock
+        self.tzinfo = tzinfo
+        self.weekdays_only = weekdays_only
+        self.exclude = frozenset(exclude)
+
+
+    @classmethod
+    def from_db(cls, rule, tzinfo):
+        """ DailyRule from the dict to_db makes """
+        day = lambda text: datetime.date(*map(int, text.split("-")))
+        return cls(day(rule["begin_date"]), day(rule["end_date"]),
+                   tuple(rule["begin_time"]), tuple(rule["end_time"]), tzinfo,
+                   rule.get("weekdays_only", False),
+                   [ day(text) for text in rule.get("exclude", []) ])
+
+
+    def to_db(self):
+        return { "begin_date": self.begin_date.isoformat(),
+                 "end_date": self.end_date.isoformat(),
+                 "begin_time": list(self.begin_clock),
+                 "end_time": list(self.end_clock),
+                 "weekdays_only": self.weekdays_only,
+                 "exclude": sorted(date.isoformat() for date in self.exclude) }
+
+
+    def first(self):
+        """ Aware datetime the rule's range begins at """
+        return at(self.begin_date, self.begin_clock, self.tzinfo)
+
+
+    def last(self):
+        """ Aware datetime the rule's range ends at """
+        return at(self.end_date, self.end_clock, self.tzinfo)
+
+
+    def windows(self, lo=None, hi=None):
+        """
+        Generate (begin, end) epoch seconds of each window in order,
+        only for days whose window meets lo..hi (epoch seconds) if
+        they are given
+        """
+        one_day = datetime.timedelta(days=1)
+        first, last = self.begin_date, self.end_date
+        # Bounds are clamped to the range first, since one far outside
+        # it can be past the dates datetime can hold
+        begin_ts, end_ts = epoch(self.first()), epoch(self.last())
+        clamp = lambda ts: min(max(ts, begin_ts), end_ts)
+        # A day's window can't start before it or end after it in
+        # its own zone, so a day either side of lo..hi covers it
+        if lo is not None:
+            lo = clamp(lo)
+            first = max(first, datetime.datetime.fromtimestamp(lo, self.tzinfo).date() - one_day)
+        if hi is not None:
+            hi = clamp(hi)
+            last = min(last, datetime.datetime.fromtimestamp(hi, self.tzinfo).date() + one_day)
+        for begin, end in daily_windows(first, last, self.begin_clock,
+                                        self.end_clock, self.tzinfo):
+            date = begin.date()
+            if date in self.exclude or (self.weekdays_only and date.weekday() >= 5):
+                continue
+            begin, end = epoch(begin), epoch(end)
+            if begin >= end:
+                continue
+            if (lo is None or end > lo) and (hi is None or begin < hi):
+                yield begin, end
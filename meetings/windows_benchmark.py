@@ -0,0 +1,80 @@
+"""
+Benchmark for generating a schedule's daily windows in create().
+
+    python3 windows_benchmark.py [days ...]
+
+Times the windows module (parse once, generate by date arithmetic)
+against the old path that round-tripped every day through ISO text
+with arrow, for ranges of the given numbers of days.
+"""
+
+import argparse
+import datetime
+import time
+
+import arrow
+from dateutil import tz
+
+import windows
+
+
+def old_windows(date_text, days, begin_text, end_text):
+    """ The original create() loop, for comparison """
+    time_formats = ["ha", "h:mma",  "h:mm a", "H:mm"]
+    begin_date = arrow.get(arrow.get(date_text, "MM/DD/YYYY").replace(
+        tzinfo=tz.tzlocal()).isoformat())
+    begin_time = arrow.get(arrow.get(begin_text, time_formats).replace(
+        tzinfo=tz.tzlocal()).replace(year=2016).isoformat())
+    end_time = arrow.get(arrow.get(end_text, time_formats).replace(
+        tzinfo=tz.tzlocal()).replace(year=2016).isoformat())
+
+    def add_time(date_text, time_text):
+        date_arrow = arrow.get(date_text)
+        time_arrow = arrow.get(time_text)
+        return date_arrow.shift(hours=+time_arrow.hour,
+                                minutes=+time_arrow.minute).isoformat()
+
+    def next_day(isotext):
+        return arrow.get(isotext).replace(days=+1).isoformat()
+
+    begin = add_time(begin_date, begin_time)
+    end = add_time(begin_date, end_time)
+    initial = []
+    for day in range(days):
+        initial.append({ 'begin': begin, 'end': end })
+        begin = next_day(begin)
+        end = next_day(end)
+    return initial
+
+
+def new_windows(date_text, days, begin_text, end_text):
+    begin_date = windows.parse_date(date_text)
+    end_date = begin_date + datetime.timedelta(days=days - 1)
+    local = windows.get_tz("America/Los_Angeles")
+    return [ { 'begin': begin.isoformat(), 'end': end.isoformat() }
+             for begin, end in windows.daily_windows(
+                 begin_date, end_date, windows.parse_clock(begin_text),
+                 windows.parse_clock(end_text), local) ]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Daily window benchmarks")
+    parser.add_argument("days", type=int, nargs="*", default=[7, 31, 182, 365])
+    args = parser.parse_args()
+
+    print("{:>6} {:>12} {:>12}".format("days", "arrow", "windows"))
+    for days in args.days:
+        print("{:>6} {:>11.4f}s {:>11.4f}s".format(
+            days,
+            timed(old_windows, "11/16/2017", days, "9:00am", "17:00"),
+            timed(new_windows, "11/16/2017", days, "9:00am", "17:00")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import nose, datetime
+from windows import get_tz, parse_date, parse_clock, daily_windows, epoch, isoformat, DailyRule
+
+
+#
+#  GLOBAL VARS
+#
+
+
+pacific = get_tz("America/Los_Angeles")
+
+
+#
+#  PARSING TESTING
+#
+
+
+def test_parse_date():
+
+    assert parse_date("11/16/2017") == datetime.date(2017, 11, 16)
+    try:
+        parse_date("2017-11-16")
+        assert False, "Expected ValueError"
+    except ValueError:
+        pass
+
+
+def test_parse_clock():
+
+    assert parse_clock("1pm") == (13, 0)
+    assert parse_clock("12am") == (0, 0)
+    assert parse_clock("1:30pm") == (13, 30)
+    assert parse_clock("1:30 PM") == (13, 30)
+    assert parse_clock("13:30") == (13, 30)
+    assert parse_clock("09:05") == (9, 5)
+    for text in [ "13", "13pm", "25:00", "noon", "" ]:
+        try:
+            parse_clock(text)
+            assert False, "Expected ValueError for '{}'".format(text)
+        except ValueError:
+            pass
+
+
+def test_get_tz_cached():
+
+    assert get_tz("America/Los_Angeles") is pacific
+    assert get_tz("UTC") is get_tz("UTC")
+    # Zones newer than dateutil's own copy of the database
+    for name in ("Pacific/Kanton", "America/Ciudad_Juarez"):
+        assert get_tz(name).utcoffset(datetime.datetime(2023, 6, 1)) is not None
+    # Only IANA names: not POSIX TZ strings, paths or the local zone
+    for name in ("Mars/Olympus_Mons", "ABC+3", "EST5EDT,M3.2.0,M11.1.0",
+                 "/usr/share/zoneinfo/America/Los_Angeles",
+                 "../zoneinfo/UTC", "", None):
+        try:
+            get_tz(name)
+            assert False, "Expected ValueError for '{}'".format(name)
+        except ValueError:
+            pass
+
+
+#
+#  WINDOW TESTING
+#
+
+
+def test_daily_windows_across_dst():
+
+    # Pacific time falls back on Sunday 11/5/2017
+    days = list(daily_windows(datetime.date(2017, 11, 4),
+                              datetime.date(2017, 11, 6),
+                              (9, 0), (17, 0), pacific))
+    assert [ (epoch(b), epoch(e)) for b, e in days ] == [
+        (1509811200, 1509840000),  # 9-5 PDT, 16:00-00:00 UTC
+        (1509901200, 1509930000),  # 9-5 PST, 17:00-01:00 UTC
+        (1509987600, 1510016400) ]
+    assert days[0][0].isoformat() == "2017-11-04T09:00:00-07:00"
+    assert days[1][0].isoformat() == "2017-11-05T09:00:00-08:00"
+    assert isoformat(1509901200, pacific) == "2017-11-05T09:00:00-08:00"
+
+
+def test_daily_rule():
+
+    # Fri 11/3 through Tue 11/7, 9-5, skipping the weekend and Monday
+    rule = DailyRule(datetime.date(2017, 11, 3), datetime.date(2017, 11, 7),
+                     (9, 0), (17, 0), pacific, weekdays_only=True,
+                     exclude=[ datetime.date(2017, 11, 6) ])
+    friday, tuesday = 1509724800, 1510074000
+    assert list(rule.windows()) == [ (friday, friday + 8 * 60 * 60),
+                                     (tuesday, tuesday + 8 * 60 * 60) ]
+    assert DailyRule.from_db(rule.to_db(), pacific).to_db() == rule.to_db()
+    assert rule.first().isoformat() == "2017-11-03T09:00:00-07:00"
+
+
+def test_daily_rule_window():
+
+    # Only days meeting lo..hi are expanded, however long the range
+    rule = DailyRule(datetime.date(2017, 1, 1), datetime.date(2027, 1, 1),
+                     (9, 0), (17, 0), pacific)
+    lo = 1509987600  # 11/6/2017 9:00 PST
+    assert list(rule.windows(lo, lo + 60)) == [ (lo, lo + 8 * 60 * 60) ]
+    assert len(list(rule.windows(lo - 60, lo + 2 * 24 * 60 * 60 + 1))) == 3
+    assert list(rule.windows(lo + 8 * 60 * 60, lo + 16 * 60 * 60)) == [ ]
+    # Bounds past what datetime can hold are clamped to the range
+    year_1, year_9999 = -62135596800, 253402300799
+    assert len(list(rule.windows(year_1, year_9999))) == len(list(rule.windows()))
+    assert list(rule.windows(year_9999, year_9999)) == [ ]
+    assert list(rule.windows(year_1, year_1)) == [ ]